@@ -1,6 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+
 def main():
-    print("Hello from cartohd!")
+    # same as the 'cartohd' command
+    from cli import main as cli_main
+    return cli_main()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
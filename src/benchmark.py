@@ -0,0 +1,342 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import perf
+
+
+# default location of the stored baselines
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# projection and resolution of the synthetic data: Lambert 93, 20cm
+CRS = "EPSG:2154"
+RESOLUTION = 0.2
+ORIGIN = (900000.0, 6500000.0)
+
+
+
+def synthetic_terrain(size, seed=0, resolution=RESOLUTION):
+    """
+    Generate a synthetic DTM and DSM: smooth hilly terrain, with flat roofed buildings and trees on top for the DSM.
+
+    Parameters:
+        size (int): The raster size, in pixels.
+        seed (int): The random seed.
+        resolution (float): The pixel size, in meters.
+
+    Returns:
+        dtm, dsm, building, vegetation (np.ndarray): The ground and surface elevations, and the building and vegetation masks.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+
+    # terrain: sum of random sinusoids, some tens of meters of relief
+    y, x = np.mgrid[0:size, 0:size] * resolution
+    dtm = np.full((size, size), 200.0)
+    for _ in range(6):
+        fx, fy = rng.uniform(0.002, 0.03, 2)
+        dtm += rng.uniform(1, 8) * np.sin(2 * np.pi * (fx * x + fy * y) + rng.uniform(0, 2 * np.pi))
+
+    dsm = dtm.copy()
+    building = np.zeros((size, size), dtype=bool)
+    vegetation = np.zeros((size, size), dtype=bool)
+
+    # buildings: rectangles with flat roofs, about 10% of the area
+    for _ in range(max(1, size * size // 4000)):
+        w, h = rng.integers(20, 80, 2)
+        c, r = rng.integers(0, size, 2)
+        block = (slice(r, r + h), slice(c, c + w))
+        dsm[block] = dtm[block].max() + rng.uniform(3, 30)
+        building[block] = True
+
+    # trees: discs
+    for _ in range(max(1, size * size // 2000)):
+        radius = rng.uniform(3, 20)
+        c, r = rng.uniform(0, size, 2)
+        disc = ((x / resolution - c) ** 2 + (y / resolution - r) ** 2) < radius ** 2
+        disc &= ~building
+        dsm[disc] = np.maximum(dsm[disc], dtm[disc] + rng.uniform(2, 20))
+        vegetation |= disc
+
+    return dtm, dsm, building, vegetation
+
+
+def write_raster(path, data, nodata=-9999, resolution=RESOLUTION):
+    """
+    Write a single band array as a GeoTIFF, with the synthetic data georeferencing.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+    with rasterio.open(
+        path, "w", driver="GTiff",
+        height=data.shape[0], width=data.shape[1], count=1, dtype=data.dtype,
+        crs=CRS, transform=from_origin(ORIGIN[0], ORIGIN[1] + data.shape[0] * resolution, resolution, resolution),
+        nodata=nodata,
+    ) as dst:
+        dst.write(data, 1)
+
+
+def synthetic_rasters(folder, size, seed=0):
+    """
+    Generate synthetic rasters of a given size, as produced by the PDAL pipelines: dsm.tif, dtm.tif with some no data holes,
+    and building.tif, vegetation.tif masks with value 1 and float64 type.
+    Files already generated are reused.
+
+    Returns:
+        dict: The file paths, by product name.
+    """
+    import numpy as np
+    paths = {name: os.path.join(folder, f"{name}_{size}_{seed}.tif") for name in ["dsm", "dtm", "building", "vegetation"]}
+    if all(os.path.exists(p) for p in paths.values()): return paths
+
+    dtm, dsm, building, vegetation = synthetic_terrain(size, seed)
+    rng = np.random.default_rng(seed + 1)
+    holes = rng.random((size, size)) < 0.02
+    write_raster(paths["dsm"], np.where(holes, -9999, dsm).astype(np.float64))
+    write_raster(paths["dtm"], np.where(holes | building, -9999, dtm).astype(np.float64))
+    write_raster(paths["building"], np.where(building, 1, -9999).astype(np.float64))
+    write_raster(paths["vegetation"], np.where(vegetation, 1, -9999).astype(np.float64))
+    return paths
+
+
+def synthetic_las(path, size, seed=0, density=10):
+    """
+    Generate a synthetic LAS file on a square area, with ground (2), vegetation (3 to 5) and building (6) points.
+
+    Parameters:
+        path (str): The output LAS file path.
+        size (int): The area size, in 20cm pixels.
+        seed (int): The random seed.
+        density (float): The number of points per square meter.
+    """
+    import numpy as np
+    import pdal
+    if os.path.exists(path): return path
+
+    dtm, dsm, building, vegetation = synthetic_terrain(size, seed)
+    rng = np.random.default_rng(seed)
+    extent = size * RESOLUTION
+    n = int(density * extent * extent)
+
+    col = rng.integers(0, size, n)
+    row = rng.integers(0, size, n)
+    is_building = building[row, col]
+    is_vegetation = vegetation[row, col] & (rng.random(n) < 0.7)
+
+    points = np.zeros(n, dtype=[("X", np.float64), ("Y", np.float64), ("Z", np.float64), ("Classification", np.uint8)])
+    points["X"] = ORIGIN[0] + (col + rng.random(n)) * RESOLUTION
+    points["Y"] = ORIGIN[1] + extent - (row + rng.random(n)) * RESOLUTION
+    points["Z"] = dtm[row, col]
+    points["Classification"] = 2
+    points["Z"][is_building] = dsm[row, col][is_building]
+    points["Classification"][is_building] = 6
+    height = dsm[row, col] - dtm[row, col]
+    points["Z"][is_vegetation] = dtm[row, col][is_vegetation] + rng.random(is_vegetation.sum()) * height[is_vegetation]
+    points["Classification"][is_vegetation] = np.digitize(points["Z"][is_vegetation] - dtm[row, col][is_vegetation], [0.5, 1.5]) + 3
+
+    pipeline = pdal.Writer.las(filename=path, a_srs=CRS, scale_x=0.01, scale_y=0.01, scale_z=0.01).pipeline(points)
+    pipeline.execute()
+    return path
+
+
+def synthetic_contours(path, size, seed=0):
+    """
+    Generate a synthetic contours GPKG file with a 'contour' layer and an 'elevation' field.
+    The size is the number of random lines, each with 20 vertices.
+    """
+    import numpy as np
+    import geopandas as gpd
+    from shapely.geometry import LineString
+    if os.path.exists(path): return path
+
+    rng = np.random.default_rng(seed)
+    lines, elevations = [], []
+    for i in range(size):
+        x = ORIGIN[0] + np.sort(rng.uniform(0, size * RESOLUTION, 20))
+        y = ORIGIN[1] + rng.uniform(0, size * RESOLUTION, 20)
+        lines.append(LineString(np.column_stack([x, y])))
+        elevations.append(float(200 + i % 50))
+    gpd.GeoDataFrame({"elevation": elevations}, geometry=lines, crs=CRS).to_file(path, layer="contour", driver="GPKG")
+    return path
+
+
+
+def bench_compute_rayshading(folder, size):
+    from cartoHD import compute_rayshading
+    dsm = synthetic_rasters(folder, size)["dsm"]
+    return lambda: compute_rayshading(dsm, os.path.join(folder, "shadow.tif"), light_altitude=15)
+
+def bench_sequential_buffer_tiff(folder, size):
+    from cartoHD import sequential_buffer_tiff
+    building = synthetic_rasters(folder, size)["building"]
+    return lambda: sequential_buffer_tiff(building, os.path.join(folder, "building_clean.tif"), [3, -3])
+
+def bench_smooth(folder, size):
+    from cartoHD import smooth
+    dtm = synthetic_rasters(folder, size)["dtm"]
+    return lambda: smooth(dtm, os.path.join(folder, "dtm_smoothed.tif"), 6)
+
+def bench_contour_type_field(folder, size):
+    from cartoHD import contour_type_field
+    contours = synthetic_contours(os.path.join(folder, f"contours_{size}.gpkg"), size)
+    return lambda: contour_type_field(contours, "contour", os.path.join(folder, "contours_typed.gpkg"))
+
+def bench_tile_raster_xyz(folder, size):
+    from tiler.tiler import tile_raster_xyz
+    dsm = synthetic_rasters(folder, size)["dsm"]
+    return lambda: tile_raster_xyz(dsm, os.path.join(folder, "tiles"), min_zoom=16, max_zoom=19)
+
+def bench_cartoHDprocess(folder, size):
+    from cartoHD import cartoHDprocess
+    las = synthetic_las(os.path.join(folder, f"points_{size}.las"), size)
+    out = os.path.join(folder, f"out_{size}", "")
+
+    # each repeat starts from an empty output folder, as the first one: the cleanup is not timed
+    prepare = lambda: shutil.rmtree(out, ignore_errors=True)
+    return prepare, lambda: cartoHDprocess(las, out, case="FR", report_file=os.path.join(folder, "report.json"))
+
+
+# benchmarks, with their sizes in pixels. The ray shading is much slower than the others.
+# Each function generates the synthetic data if needed, and returns the function to time,
+# or a (prepare, run) pair when some preparation must run before each repeat.
+BENCHMARKS = {
+    "compute_rayshading": (bench_compute_rayshading, [64, 128, 256]),
+    "sequential_buffer_tiff": (bench_sequential_buffer_tiff, [500, 1000, 2000]),
+    "smooth": (bench_smooth, [500, 1000, 2000]),
+    "contour_type_field": (bench_contour_type_field, [1000, 5000, 20000]),
+    "tile_raster_xyz": (bench_tile_raster_xyz, [500, 1000, 2000]),
+    "cartoHDprocess": (bench_cartoHDprocess, [250, 500]),
+}
+
+
+
+def _run_case(name, folder, size, repeat, queue):
+    # executed in a fresh process, so that the peak memory is the one of this benchmark only
+    logging.basicConfig(level=logging.WARNING)
+    make, _ = BENCHMARKS[name]
+    # the synthetic data was generated by the parent process: it is only read here
+    func = make(folder, size)
+    prepare, func = func if isinstance(func, tuple) else (None, func)
+    rss_before = perf.peak_rss_bytes()
+    times = []
+    for _ in range(repeat):
+        if prepare: prepare()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    queue.put({"time_s": min(times), "peak_rss_bytes": perf.peak_rss_bytes(), "setup_rss_bytes": rss_before})
+
+
+def run_benchmark(name, size, folder, repeat=3):
+    """
+    Run a benchmark in a separate process, and return its best time over several repeats and its peak memory.
+    The synthetic data is generated beforehand in this process, so that the peak memory of the benchmark process
+    does not depend on whether the data was already generated.
+
+    Parameters:
+        name (str): The benchmark name, a key of BENCHMARKS.
+        size (int): The benchmark size.
+        folder (str): The folder where the synthetic data is generated.
+        repeat (int): The number of repeats.
+
+    Returns:
+        dict: The result with 'time_s' and 'peak_rss_bytes'.
+    """
+    BENCHMARKS[name][0](folder, size)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(name, folder, size, repeat, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0: raise RuntimeError(f"Benchmark {name} with size {size} failed")
+    return queue.get()
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare benchmark results to a baseline.
+
+    Parameters:
+        results (dict): The results, by benchmark key.
+        baseline (dict): The baseline results, by benchmark key.
+        threshold (float): The relative increase from which a time or memory increase is a regression.
+
+    Returns:
+        list of str: The regressions descriptions.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base: continue
+        for metric in ["time_s", "peak_rss_bytes"]:
+            ratio = result[metric] / base[metric] if base[metric] else 1
+            if ratio > 1 + threshold:
+                regressions.append(f"{key}: {metric} {base[metric]:.4g} -> {result[metric]:.4g} (+{(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+
+def run_benchmarks(names=None, sizes=None, repeat=3, baseline_file=BASELINE_FILE, save_baseline=False, threshold=0.2, folder=None):
+    """
+    Run the benchmarks, compare them to the stored baseline and optionally store them as the new baseline.
+
+    Parameters:
+        names (list of str): The benchmarks to run. All by default.
+        sizes (list of int): The sizes to run, instead of the default sizes of each benchmark.
+        repeat (int): The number of repeats of each benchmark.
+        baseline_file (str): The baseline JSON file.
+        save_baseline (bool): Whether to store the results as the new baseline.
+        threshold (float): The relative increase from which a time or memory increase is a regression.
+        folder (str): The folder where the synthetic data is generated. A temporary folder by default.
+
+    Returns:
+        list of str: The regressions descriptions.
+    """
+    folder = folder or os.path.join(tempfile.gettempdir(), "cartohd_benchmark")
+    os.makedirs(folder, exist_ok=True)
+
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f: baseline = json.load(f)
+
+    results = {}
+    for name in names or BENCHMARKS:
+        for size in sizes or BENCHMARKS[name][1]:
+            key = f"{name}@{size}"
+            results[key] = run_benchmark(name, size, folder, repeat)
+            logging.info(f"{key}: {results[key]['time_s']:.3f}s, peak rss {results[key]['peak_rss_bytes'] / 2**20:.0f} MB")
+
+    regressions = compare(results, baseline, threshold)
+    for r in regressions: logging.warning(f"Regression {r}")
+
+    if save_baseline:
+        baseline.update(results)
+        with open(baseline_file, "w") as f: json.dump(baseline, f, indent=3, sort_keys=True)
+        logging.info(f"Baseline saved to {baseline_file}")
+    return regressions
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(funcName)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(description="Benchmark the CartoHD processing hot paths on synthetic data.")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, among: " + ", ".join(BENCHMARKS) + ". All by default.")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Sizes to run instead of the default ones.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase flagged as regression.")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown: parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    regressions = run_benchmarks(args.names, args.sizes, args.repeat, args.baseline, args.save_baseline, args.threshold)
+    sys.exit(1 if regressions else 0)
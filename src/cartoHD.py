@@ -1,22 +1,150 @@
 import math
 from math import ceil, hypot, floor
 import subprocess
-import numpy as np
-import rasterio
-import geopandas as gpd
-from scipy.ndimage import binary_dilation, gaussian_filter, binary_erosion
 import json
 import os
+import glob
+import time
+import tempfile
 import logging
+from functools import partial
+import perf
+import raster_formats
+import rasterize
+import raster_algebra
+import las_header
+import incremental
+import planner
+from scheduler import Stage, run_stages
+
+# numpy, rasterio, scipy and geopandas are imported in the functions using them, so that importing this module is fast
+
+# raster products, converted into Cloud Optimized GeoTIFF at the end of the processing, and updated by splicing
+# (see incremental.py): overviews resampling, and encoding. The "elevation" rasters are quantised with quantize_elevation only.
+RASTER_PRODUCTS = [
+    ("dsm.tif", "AVERAGE", "elevation"), ("slope_dsm.tif", "AVERAGE", "slope"), ("shadow.tif", "AVERAGE", None),
+    ("dtm.tif", "AVERAGE", "elevation"), ("dtm_building.tif", "AVERAGE", "elevation"), ("slope_dtm.tif", "AVERAGE", "slope"), ("slope_dtm_building.tif", "AVERAGE", "slope"),
+    ("dsm_vegetation.tif", "AVERAGE", "elevation"), ("vegetation_clean.tif", "NEAREST", None), ("dsm_building.tif", "AVERAGE", "elevation"),
+    ("ndsm.tif", "AVERAGE", None), ("canopy_height.tif", "AVERAGE", None), ("canopy_height_bands.tif", "NEAREST", None),
+]
+
+
+
+def run_command(command, inputs=None, outputs=None, items=None, unit="pixels"):
+    """
+    Run an external command and record its wall time, cpu time and peak memory into the run report.
+    Raise subprocess.CalledProcessError if the command fails.
+
+    Parameters:
+        command (list of str): The command and its arguments.
+        inputs (list of str): The input files, to measure the input volume.
+        outputs (list of str): The output files, to measure the output volume and the processed pixels.
+        items (int or callable): The number of processed points or pixels, when known. A callable is evaluated once the command has completed.
+        unit (str): The unit of the processed items, "pixels" or "points".
+    """
+    input_bytes = perf.files_size(inputs)
+    t0 = time.perf_counter()
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        process = subprocess.Popen(command, stdout=out, stderr=err)
+        # wait4 gives the resource usage of this child only, also when several commands run concurrently
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - t0
+        out.seek(0); err.seek(0)
+        stdout = out.read().decode(errors="replace")
+        stderr = err.read().decode(errors="replace")
+
+    if stdout: logging.info(stdout)
+    if stderr:
+        if process.returncode != 0: logging.error(f"Error: {stderr}")
+        else: logging.warning(stderr)
+
+    outputs = list(outputs or [])
+    if callable(items): items = items()
+    if items is None and unit == "pixels" and outputs: items = perf.raster_pixels(outputs[0])
+    perf.add_stage_record({
+        "name": os.path.basename(command[0]) + (" " + command[1] if len(command) > 1 and command[1].isalpha() else ""),
+        "kind": "command",
+        "command": command,
+        "returncode": process.returncode,
+        "unit": unit,
+        "inputs": list(inputs or []),
+        "outputs": outputs,
+        "input_bytes": input_bytes,
+        "output_bytes": perf.files_size(outputs),
+        "items": items,
+        "wall_s": wall,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_bytes": usage.ru_maxrss * perf._MAXRSS_UNIT,
+    })
+    if process.returncode != 0: raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+
+
+
+def pdal_point_count(metadata_file):
+    """
+    Return the number of points read by a PDAL pipeline, from the metadata file written with 'pdal pipeline --metadata'.
+    Return None if it cannot be found.
+    """
+    def count(node):
+        if isinstance(node, list): return sum(count(n) for n in node)
+        if isinstance(node, dict): return node.get("count", 0) if isinstance(node.get("count"), int) else 0
+        return 0
 
+    try:
+        with open(metadata_file) as f: stages = json.load(f)["stages"]
+        return sum(count(v) for k, v in stages.items() if k.startswith("readers.")) or None
+    except (OSError, ValueError, KeyError):
+        return None
 
 
-def run_command(command):
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.stdout: logging.info(result.stdout)
-    if result.stderr:
-        logging.error(f"Error: {result.stderr}")
+def run_pdal_pipeline(data, pipeline_file):
+    """
+    Save a PDAL pipeline as JSON and execute it. The points read and the written rasters are recorded into the run report.
+
+    Parameters:
+        data (list of dict): The PDAL pipeline stages.
+        pipeline_file (str): The path where to save the pipeline JSON file.
+    """
+    with open(pipeline_file, "w") as f: json.dump(data, f, indent=3)
+
+    inputs = []
+    for s in data:
+        if s["type"].startswith("readers."): inputs.extend(glob.glob(s["filename"]))
+    outputs = [s["filename"] for s in data if s["type"].startswith("writers.")]
 
+    metadata_file = os.path.splitext(pipeline_file)[0] + "_metadata.json"
+    run_command(["pdal", "pipeline", pipeline_file, "--metadata", metadata_file],
+                       inputs=inputs, outputs=outputs, items=lambda: pdal_point_count(metadata_file), unit="points")
+
+
+
+def write_mask(output_path, mask, src, threads="ALL_CPUS"):
+    """
+    Save a boolean mask as a uint8 GeoTIFF, with value 1 for the mask pixels and 0 as no data value.
+
+    Parameters:
+        output_path (str): Path to save the mask TIFF file.
+        mask (np.ndarray): The boolean mask.
+        src (rasterio.DatasetReader): The raster to take the georeferencing from.
+        threads (int or str): The number of compression threads, or "ALL_CPUS".
+    """
+    import rasterio
+    e = raster_formats.ENCODINGS["mask"]
+    with rasterio.open(
+        output_path,
+        "w",
+        driver="GTiff",
+        height=mask.shape[0],
+        width=mask.shape[1],
+        count=1,
+        dtype=e["dtype"],
+        crs=src.crs,
+        transform=src.transform,
+        nodata=e["nodata"],
+        **raster_formats.rasterio_options(e["dtype"], threads)
+    ) as dst:
+        dst.write(mask.astype(e["dtype"]), 1)
 
 
 def buffer_tiff(input_path, output_path, buffer_distance):
@@ -30,16 +158,16 @@ def buffer_tiff(input_path, output_path, buffer_distance):
         buffer_distance (int): Number of pixels to buffer.
                                Positive values expand, negative values shrink.
     """
+    import numpy as np
+    import rasterio
+    from scipy.ndimage import binary_dilation, binary_erosion
     # Open the TIFF file
     with rasterio.open(input_path) as src:
         data = src.read(1)  # Read the first band
-        no_data_value = src.nodata
-        
-        if no_data_value is None:
-            raise ValueError("Input TIFF file does not specify a 'no_data' value.")
 
         # Create a mask of pixels with value 1
         valid_data_mask = data == 1
+        del data
 
         # Generate a structuring element for the operation
         abs_buffer_distance = abs(buffer_distance)
@@ -56,26 +184,11 @@ def buffer_tiff(input_path, output_path, buffer_distance):
             # No buffer, keep the original
             buffered_mask = valid_data_mask
 
-        # Create a new array, keeping 'no_data_value' in the background
-        buffered_data = np.where(buffered_mask, 1, no_data_value)
-
-        # Save the buffered result
-        with rasterio.open(
-            output_path,
-            "w",
-            driver="GTiff",
-            height=data.shape[0],
-            width=data.shape[1],
-            count=1,
-            dtype=data.dtype,
-            crs=src.crs,
-            transform=src.transform,
-            nodata=no_data_value
-        ) as dst:
-            dst.write(buffered_data, 1)
-
-
-def sequential_buffer_tiff(input_path, output_path, buffer_distances):
+        # Save the buffered result, as a uint8 mask with 0 as no data value
+        write_mask(output_path, buffered_mask, src)
+
+
+def sequential_buffer_tiff(input_path, output_path, buffer_distances, threads="ALL_CPUS"):
     """
     Applies a sequence of buffer operations (both positive and negative) on a TIFF image.
 
@@ -83,16 +196,17 @@ def sequential_buffer_tiff(input_path, output_path, buffer_distances):
         input_path (str): Path to the input TIFF file.
         output_path (str): Path to save the final buffered TIFF file.
         buffer_distances (list of int): List of buffer distances - in pixel number !!! (positive for expansion, negative for shrinking).
+        threads (int or str): The number of threads compressing the output, or "ALL_CPUS".
     """
+    import numpy as np
+    import rasterio
+    from scipy.ndimage import binary_dilation, binary_erosion
     with rasterio.open(input_path) as src:
         data = src.read(1)  # Read the first band
-        no_data_value = src.nodata
-        
-        if no_data_value is None:
-            raise ValueError("Input TIFF file does not specify a 'no_data' value.")
 
         # Create a mask of pixels with value 1
         current_mask = data == 1
+        del data
 
         # Apply each buffer operation sequentially
         for buffer_distance in buffer_distances:
@@ -107,27 +221,12 @@ def sequential_buffer_tiff(input_path, output_path, buffer_distances):
                 current_mask = binary_erosion(current_mask, structure=structure)
             # If buffer_distance == 0, skip (no operation for zero buffer)
 
-        # Create the final array, keeping 'no_data_value' in the background
-        final_data = np.where(current_mask, 1, no_data_value)
-
-        # Save the final result
-        with rasterio.open(
-            output_path,
-            "w",
-            driver="GTiff",
-            height=data.shape[0],
-            width=data.shape[1],
-            count=1,
-            dtype=data.dtype,
-            crs=src.crs,
-            transform=src.transform,
-            nodata=no_data_value
-        ) as dst:
-            dst.write(final_data, 1)
+        # Save the final result, as a uint8 mask with 0 as no data value
+        write_mask(output_path, current_mask, src, threads)
 
 
 
-def smooth(input_file, output_file, sigma):
+def smooth(input_file, output_file, sigma, threads="ALL_CPUS"):
     """
     Apply kernel smoothing to a TIFF
 
@@ -135,43 +234,201 @@ def smooth(input_file, output_file, sigma):
     - input_file: str, path to the input DTM GeoTIFF file.
     - output_file: str, path to save the smoothed DTM GeoTIFF file.
     - sigma: float, standard deviation for Gaussian kernel.
+    - threads: int or str, number of threads compressing the output, or "ALL_CPUS".
 
     Returns:
     - None
     """
+    import numpy as np
+    import rasterio
+    from scipy.ndimage import gaussian_filter
 
     with rasterio.open(input_file) as src:
-        dtm = src.read(1, masked=True)
+        # elevation values in float32, whatever the input encoding
+        dtm = raster_formats.read_values(src)
         profile = src.profile
 
         # Apply Gaussian smoothing
         smoothed_dtm = gaussian_filter(dtm.filled(np.nan), sigma=sigma)
 
-        # Replace masked nodata regions with original nodata value
-        smoothed_dtm = np.where(dtm.mask, profile['nodata'], smoothed_dtm)
+        # Replace masked nodata regions with nodata value
+        smoothed_dtm = raster_formats.encode(np.ma.masked_array(smoothed_dtm, dtm.mask), "elevation")
 
     # Update the profile for output
-    profile.update(dtype=rasterio.float32, count=1, compress='lzw')
+    e = raster_formats.ENCODINGS["elevation"]
+    profile.update(dtype=e["dtype"], nodata=e["nodata"], count=1, **raster_formats.rasterio_options(e["dtype"], threads))
 
     # Save the smoothed DTM
     with rasterio.open(output_file, 'w', **profile) as dst:
-        dst.write(smoothed_dtm.astype(rasterio.float32), 1)
+        dst.write(smoothed_dtm, 1)
+
+
+def encode_raster(input_path, output_path, encoding, threads="ALL_CPUS"):
+    """
+    Rewrite a raster with an encoding of raster_formats.ENCODINGS, block by block.
+
+    Parameters:
+        input_path (str): Path to the input raster.
+        output_path (str): Path to the output raster.
+        encoding (str): The encoding name, for example "slope" or "elevation_cm".
+        threads (int or str): The number of compression threads, or "ALL_CPUS".
+    """
+    import rasterio
+    e = raster_formats.ENCODINGS[encoding]
+    with rasterio.open(input_path) as src:
+        profile = src.profile
+        profile.update(dtype=e["dtype"], nodata=e["nodata"], count=1, **raster_formats.rasterio_options(e["dtype"], threads))
+        with rasterio.open(output_path, "w", **profile) as dst:
+            dst.scales = (e["scale"],)
+            dst.offsets = (e["offset"],)
+            for _, window in dst.block_windows(1):
+                dst.write(raster_formats.encode(raster_formats.read_values(src, window=window, dtype="float64"), encoding), 1, window=window)
+
+
+def to_cog(path, resampling="AVERAGE", encoding=None, threads="ALL_CPUS"):
+    """
+    Convert a GeoTIFF file into a Cloud Optimized GeoTIFF, with overviews, in place.
+
+    Parameters:
+        path (str): The GeoTIFF file path.
+        resampling (str): The overviews resampling method. Use NEAREST or MODE for classes and masks.
+        encoding (str): An encoding of raster_formats.ENCODINGS to convert the raster to. Optional.
+        threads (int or str): The number of compression threads, or "ALL_CPUS".
+    """
+    import rasterio
+    source = path
+    if encoding:
+        source = path + ".encoded.tif"
+        encode_raster(path, source, encoding, threads)
+
+    with rasterio.open(source) as src: dtype = src.dtypes[0]
+    cog_path = path + ".cog.tif"
+    run_command(["gdal_translate", *raster_formats.cog_args(dtype, resampling, threads), source, cog_path], inputs=[source], outputs=[cog_path])
+    os.replace(cog_path, path)
+    if source != path: os.remove(source)
+
+
+def make_contours(input_path, output_path, interval=1):
+    """
+    Compute the contour lines of a DTM into a GPKG file, with gdal_contour.
+    An existing output file, from an interrupted or previous run, is removed first: gdal_contour cannot overwrite it.
+
+    Parameters:
+        input_path (str): The DTM.
+        output_path (str): The GPKG file of the contour lines, with their elevation in the 'elevation' field.
+        interval (float): The elevation interval between the contour lines, in meters.
+    """
+    if os.path.exists(output_path): os.remove(output_path)
+    run_command(["gdal_contour", "-a", "elevation", "-i", str(interval), input_path, "-f", "GPKG", output_path],
+                inputs=[input_path], outputs=[output_path], items=lambda: perf.raster_pixels(input_path))
 
 
 def contour_type_field(input_file, layer_name, output_file=None):
+    import geopandas as gpd
 
     gdf = gpd.read_file(input_file, layer=layer_name)
     gdf['type'] = gdf['elevation'].apply(lambda x: 'index' if x % 5 == 0 else 'normal')
     if output_file is None: output_file = input_file
     gdf.to_file(output_file, layer=layer_name, driver="GPKG")
+    return len(gdf)
 
 
+# side of the square windows of building_attributes, in pixels: a multiple of the internal tile size of the rasters
+BUILDING_WINDOW_SIZE = 4 * raster_formats.BLOCK_SIZE
 
+# memory of building_attributes per pixel of a window: labels, values and masks of the three rasters, and temporaries
+BUILDING_BYTES_PER_PIXEL = 48
 
 
+def building_attributes(buildings_file, dsm_file, dtm_file, slope_file, output_file=None, window_size=BUILDING_WINDOW_SIZE):
+    """
+    Add height, roof slope and area attributes to building footprints, from the building DSM, the DTM and a roof slope raster.
 
+    The footprints are rasterised with their index as label, by square windows of the DSM grid, aligned on its internal
+    tiles: the memory used does not depend on the raster size. In each window, the statistics of all buildings are
+    accumulated at once with bincount and ufunc reductions on the labels, whatever the number of buildings.
+    The attributes are then written in a single update of the file.
 
-def compute_rayshading(input_file: str, output_file: str, light_azimuth: float = 315, light_altitude: float = 30, ray_max_length: int = None, jump: int = 1, show_progress: bool = False):
+    Parameters:
+        buildings_file (str): The GPKG file of the building footprints.
+        dsm_file (str): The building DSM.
+        dtm_file (str): The DTM, giving the ground elevation under the buildings, on the grid of the DSM.
+        slope_file (str): The roof slope raster, in degrees, on the grid of the DSM.
+        output_file (str): The output GPKG file. The input file is updated by default.
+        window_size (int): The side of the windows processed at once, in pixels.
+
+    Returns:
+        int: The number of buildings.
+    """
+    import numpy as np
+    import geopandas as gpd
+    import rasterio
+    from rasterio.features import rasterize
+    from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+    from shapely.geometry import box
+
+    layer_name = gpd.list_layers(buildings_file)["name"][0]
+    gdf = gpd.read_file(buildings_file, layer=layer_name)
+    n = len(gdf)
+
+    # statistics by label, the label of a building being its index + 1, 0 for no building
+    count = np.zeros(n + 1, dtype=np.int64)
+    height_sum = np.zeros(n + 1)
+    height_max = np.full(n + 1, -np.inf)
+    slope_sum = np.zeros(n + 1)
+    slope_count = np.zeros(n + 1, dtype=np.int64)
+
+    with rasterio.open(dsm_file) as dsm, rasterio.open(dtm_file) as dtm, rasterio.open(slope_file) as slope:
+        for src in [dtm, slope]:
+            if src.transform != dsm.transform or src.shape != dsm.shape:
+                raise ValueError(f"{src.name} is not on the grid of {dsm_file}")
+        gdf = gdf.to_crs(dsm.crs) if gdf.crs and dsm.crs and gdf.crs != dsm.crs else gdf
+        sindex = gdf.sindex
+        windows = [Window(col, row, min(window_size, dsm.width - col), min(window_size, dsm.height - row))
+                   for row in range(0, dsm.height, window_size) for col in range(0, dsm.width, window_size)]
+        for window in windows:
+            bounds = window_bounds(window, dsm.transform)
+            shape = (int(window.height), int(window.width))
+
+            # label raster of the window, with the footprints intersecting it only
+            index = sindex.query(box(*bounds))
+            if len(index) == 0: continue
+            labels = rasterize(zip(gdf.geometry.values[index], index + 1), out_shape=shape,
+                               transform=window_transform(window, dsm.transform), fill=0, dtype="uint32")
+
+            # values on the same pixels: all rasters are on the same grid
+            height = raster_formats.read_values(dsm, window=window) - raster_formats.read_values(dtm, window=window)
+            roof_slope = raster_formats.read_values(slope, window=window)
+
+            valid = (labels > 0) & ~np.ma.getmaskarray(height)
+            l, h = labels[valid], height.data[valid]
+            count += np.bincount(l, minlength=n + 1)
+            height_sum += np.bincount(l, weights=h, minlength=n + 1)
+            np.maximum.at(height_max, l, h)
+
+            valid = (labels > 0) & ~np.ma.getmaskarray(roof_slope)
+            l = labels[valid]
+            slope_count += np.bincount(l, minlength=n + 1)
+            slope_sum += np.bincount(l, weights=roof_slope.data[valid], minlength=n + 1)
+
+    # single batched update of the attributes, no value for the buildings without pixel
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gdf["height_mean"] = np.where(count > 0, height_sum / count, np.nan)[1:].round(2)
+        gdf["height_max"] = np.where(count > 0, height_max, np.nan)[1:].round(2)
+        gdf["roof_slope"] = np.where(slope_count > 0, slope_sum / slope_count, np.nan)[1:].round(1)
+    gdf["area"] = gdf.geometry.area.round(2)
+
+    if output_file is None: output_file = buildings_file
+    gdf.to_file(output_file, layer=layer_name, driver="GPKG")
+    return n
+
+
+
+
+
+
+
+def compute_rayshading(input_file: str, output_file: str, light_azimuth: float = 315, light_altitude: float = 30, ray_max_length: int = None, jump: int = 1, show_progress: bool = False, pixel_scale: float = 1, threads="ALL_CPUS"):
     """
     Compute rayshading for a DEM using a ray-casting algorithm.
 
@@ -185,22 +442,31 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
         Azimuth of the light source in degrees (0-360, 0=N, 90=E, 180=S, 270=W).
     light_altitude : float
         Altitude of the light source in degrees above the horizon (0-90).
+    pixel_scale : float
+        Size of the DEM pixels relative to the reference resolution (20cm), for a coarser DEM to be shaded
+        like the reference one. The distances are expressed in reference pixels.
+    threads : int or str
+        Number of threads compressing the output, or "ALL_CPUS".
 
     Returns:
     --------
     rayshaded : np.ndarray
         The computed rayshaded image (0=shadow, 1=illuminated).
     """
+    import numpy as np
+    import rasterio
 
-    # Read input DEM
-    with rasterio.open(input_file) as src: dem = src.read(1)
+    # Read input DEM, whatever its encoding. No data pixels are set to -inf
+    dem_nodata = -np.inf
+    with rasterio.open(input_file) as src: dem = raster_formats.read_values(src).filled(dem_nodata)
     # Get dimensions
     rows, cols = dem.shape
 
     # Initialize output array
     #rayshaded = np.ones_like(dem, dtype=np.uint8)
-    no_data_value = 0
-    rayshaded = np.full((rows, cols), no_data_value, dtype=np.uint16)
+    encoding = raster_formats.ENCODINGS["distance"]
+    no_data_value = encoding["nodata"]
+    rayshaded = np.full((rows, cols), no_data_value, dtype=encoding["dtype"])
 
 
     # Calculate light direction vector
@@ -208,7 +474,7 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
     dx = jump * math.cos(azimuth_rad)
     dy = jump * math.sin(azimuth_rad)
     altitude_rad = light_altitude*math.pi/180
-    dz = jump * math.tan(altitude_rad)
+    dz = jump * math.tan(altitude_rad) * pixel_scale
 
     # go through each pixel. From each one, make a ray and shade cells under until ray is stopped
     for row in range(rows):
@@ -219,7 +485,7 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
             x0, y0 = col + 0.5, row + 0.5
             z0 = dem[row, col]
 
-            if z0 == src.nodata: continue
+            if z0 == dem_nodata: continue
 
             # project ray
             x,y,z = x0,y0,z0
@@ -229,7 +495,7 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
                 z -= dz
 
                 # compute ray length
-                ray_length = hypot(x-x0, y-y0, z-z0)
+                ray_length = hypot((x-x0) * pixel_scale, (y-y0) * pixel_scale, z-z0)
                 if ray_max_length != None and ray_length > ray_max_length: break
 
                 col_, row_ = int(floor(x)), int(floor(y))
@@ -239,7 +505,7 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
 
                 # if ray was blocked, break
                 elevation = dem[row_, col_]
-                if elevation == src.nodata: continue
+                if elevation == dem_nodata: continue
                 if elevation > z: break
 
                 # get current shade value
@@ -259,10 +525,11 @@ def compute_rayshading(input_file: str, output_file: str, light_azimuth: float =
         height=rayshaded.shape[0],
         width=rayshaded.shape[1],
         count=1,
-        dtype='uint16',
+        dtype=encoding["dtype"],
         nodata=no_data_value,
         crs=src.crs,
         transform=src.transform,
+        **raster_formats.rasterio_options(encoding["dtype"], threads)
     ) as dst:
         dst.write(rayshaded, 1)
 
@@ -288,7 +555,42 @@ for angle in [10, 20,30,40,50,60]:
 
 
 
-def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
+def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None, report_file = None, max_cpu = None, max_memory = None, tmp_folder = None, checkpoint_file = None, quantize_elevation = False, streaming = False, grid_bounds = None, save_inputs = True, preview = None):
+    """
+    Produce the map layers from LiDAR data.
+
+    The processing stages are declared with the files they read and write, and run concurrently
+    as soon as their inputs are ready: the DSM, DTM, vegetation and building branches run in parallel.
+    A failure in a stage only skips the stages depending on it, and is reported once all others have run.
+
+    Parameters:
+        input_lidar_data (str): The LiDAR files, as a glob pattern.
+        output_folder (str): The output folder, with trailing slash.
+        bounds (str): The bounding box to crop the data, e.g. "([xmin, xmax],[ymin, ymax])". Optional.
+        case (str): The case identifier ("FR", "BE", "LU"), which determines the LiDAR classification codes.
+        report_file (str): The JSON run report file. output_folder/report.json by default.
+        max_cpu (int): The number of cores to use. All by default. Each stage writing rasters compresses them with a quarter
+            of the cores, and is scheduled as using that many cores.
+        max_memory (int): The memory budget, in bytes. The physical memory by default: the stages holding the whole point
+            cloud, such as the PDAL pipelines, then run concurrently only when they fit in it.
+        tmp_folder (str): The folder for temporary files, with trailing slash. output_folder/tmp/ by default.
+        checkpoint_file (str): A JSON file where the completed stages are recorded. When given, the stages
+            completed by a previous run are not executed again, so that an interrupted run resumes where it stopped.
+            The file is removed once all stages are completed.
+        quantize_elevation (bool): Whether to store the elevation products as int32 centimeters, with a 0.01 scale,
+            instead of float32 meters. The slopes are always stored as uint8 with a 0.5 degree step, the masks as uint8.
+        streaming (bool): Whether to rasterise the points by chunks, in a single reading for all products, instead of
+            running the PDAL pipelines which load all points in memory. Use it for point clouds larger than the memory.
+        grid_bounds (tuple): The (xmin, ymin, xmax, ymax) bounds of the output rasters grid. By default, the grid covers
+            the crop bounds, or the bounds of the LiDAR file headers, expanded to multiples of the resolution.
+            All rasters are written on this grid, so that they are aligned with each other and with later updates.
+        save_inputs (bool): Whether to record the input LiDAR files in output_folder/inputs.json once all stages are
+            completed, for a later incremental update with incremental.update_area.
+        preview (int): A preview factor, such as 5, to produce all layers quickly for parameter tuning: the points are
+            decimated, the rasters are produced at a resolution this factor coarser than 20cm, and the distances
+            expressed in pixels (no data filling, smoothing, buffers, ray shading) are scaled to match. Use another
+            output folder than the one of the full resolution run.
+    """
 
     codeBuilding = "1" if case=="BE" else "6"
 
@@ -297,12 +599,23 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
     process_vegetation = True
     process_building = True
     compute_dsm_rayshading = True
-    with_pdal_pipeline = True
+    with_pdal_pipeline = not streaming
+
+    # pixel size, and pixel distances at 20cm resolution scaled to it
+    scale = preview or 1
+    resolution = 0.2 * scale
+    def px(distance, minimum=1): return max(minimum, int(round(distance / scale)))
+    # keep about one point per pixel of the full resolution run
+    decimation = scale * scale
 
 
     #create necessary folders
+    tmp_folder = tmp_folder or os.path.join(output_folder, "tmp", "")
     os.makedirs(output_folder, exist_ok=True)
-    os.makedirs("tmp/", exist_ok=True)
+    os.makedirs(tmp_folder, exist_ok=True)
+
+    # record the performance of each stage into a JSON run report (output_folder/report.json by default)
+    perf.start_report("cartoHDprocess", input_lidar_data=input_lidar_data, output_folder=output_folder, bounds=bounds, case=case, preview=preview)
 
     # ensure pdal command is available through conda install
     #if with_pdal_pipeline: run_command(["conda", "activate", "pdal"])
@@ -320,17 +633,70 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
             "type": "filters.crop",
             "bounds": bounds
         })
+        if decimation > 1: data.append({
+            "type": "filters.decimation",
+            "step": decimation
+        })
         return data
 
 
+    # grid shared by all output rasters. Otherwise each PDAL writer takes its origin from its own filtered points
+    if not grid_bounds:
+        extent = las_header.parse_bounds(bounds) if bounds else las_header.union_bounds(las_header.read_headers(input_lidar_data))
+        grid_bounds = incremental.snap_bounds(extent, 0, 0, resolution)
+    xmin, ymin, xmax, ymax = grid_bounds
+    grid_options = {"origin_x": xmin, "origin_y": ymin, "width": int(round((xmax - xmin) / resolution)), "height": int(round((ymax - ymin) / resolution))}
+
+    # the four processing chains run concurrently: each stage writing rasters compresses them with a quarter of the cores,
+    # and counts as many cores in the scheduling
+    max_cpu = max_cpu or os.cpu_count() or 1
+    threads = max(1, max_cpu // 4)
+    max_memory = max_memory or planner.available_memory()
+
+    # rough memory estimates, used to schedule the stages within the memory budget
+    # PDAL standard mode holds all points in memory: about 20 times the LAZ volume
+    lidar_files = glob.glob(input_lidar_data)
+    def pdal_memory(): return 20 * perf.files_size(lidar_files)
+    def raster_memory(path, bytes_per_pixel): return lambda: (perf.raster_pixels(path) or 0) * bytes_per_pixel
+
+    def command_stage(name, command, inputs, outputs, **kwargs):
+        # a stage running an external command
+        memory = kwargs.pop("memory", 0)
+        cpu = kwargs.pop("cpu", threads)
+        return Stage(name, partial(run_command, command, inputs=inputs, outputs=outputs, **kwargs), inputs=inputs, outputs=outputs, memory=memory, cpu=cpu)
+
+    # the processing stages, in a valid sequential order, and the intermediate files to remove once used
+    stages = []
+    temporary = []
+
+    if streaming:
+        # one reading of the points by chunks, for all the rasters of the PDAL pipelines
+        products = []
+        noise = [(7, 7), (60, 70)]
+        building = [(int(codeBuilding), int(codeBuilding))]
+        if process_dsm: products.append(rasterize.product(output_folder+"dsm_raw.tif", "max", exclude=noise))
+        if process_dtm: products.extend([
+            rasterize.product(output_folder+"dtm_building.tif", "min", classes=[(2, 2)] + building),
+            rasterize.product(output_folder+"dtm_raw.tif", "min", classes=[(2, 2)])])
+        if process_vegetation: products.extend([
+            rasterize.product(output_folder+"dsm_vegetation.tif", "max", classes=[(3, 5)]),
+            rasterize.product(output_folder+"vegetation.tif", "mask", classes=[(3, 5)])])
+        if process_building: products.extend([
+            rasterize.product(output_folder+"dsm_building.tif", "max", classes=building),
+            rasterize.product(output_folder+"building.tif", "mask", classes=building)])
+
+        def streaming_memory():
+            _, _, width, height = rasterize.raster_grid(las_header.read_headers(input_lidar_data), resolution, bounds, grid_bounds)
+            return rasterize.grids_memory(width, height, products)
+
+        stages.append(Stage("rasterize streaming", partial(rasterize.rasterize_streaming, input_lidar_data, products, resolution, bounds, grid_bounds=grid_bounds, decimation=decimation, threads=threads),
+                            outputs=[p["filename"] for p in products], memory=streaming_memory, cpu=threads, instrument=True, unit="points"))
 
 
     if process_dsm:
 
         if with_pdal_pipeline:
             # prepare PDAL pipeline config
-            logging.info("pipeline DSM")
-
             data = get_base_config()
             data.extend(
         [
@@ -354,38 +720,38 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
     # max value for each 20cm pixel
     {
         "type": "writers.gdal",
+        **raster_formats.pdal_writer_options("elevation", threads),
+        **grid_options,
         "filename": output_folder+"dsm_raw.tif",
-        "resolution": 0.2,
+        "resolution": resolution,
         "output_type": "max"
     }
     ])
+            stages.append(Stage("pipeline DSM", partial(run_pdal_pipeline, data, tmp_folder+"p_dsm.json"),
+                                outputs=[output_folder+"dsm_raw.tif"], memory=pdal_memory, cpu=threads))
 
-            # execute PDAL pipeline
-            with open("tmp/p_dsm.json", "w") as f: json.dump(data, f, indent=3)
-            run_command(["pdal", "pipeline", "tmp/p_dsm.json"])
-
-        logging.info("fill dsm no data")
         #TODO: should not be linear
         #TODO: smooth ?
-        run_command(["gdal_fillnodata.py", "-md", "20", "-of", "GTiff", output_folder+"dsm_raw.tif", output_folder+"dsm.tif"])
-        os.remove(output_folder+"dsm_raw.tif")
+        stages.append(command_stage("fill dsm no data",
+            ["gdal_fillnodata.py", "-md", str(px(20)), *raster_formats.gdal_co_args(threads=threads), output_folder+"dsm_raw.tif", output_folder+"dsm.tif"],
+            inputs=[output_folder+"dsm_raw.tif"], outputs=[output_folder+"dsm.tif"], memory=raster_memory(output_folder+"dsm_raw.tif", 16)))
+        temporary.append(output_folder+"dsm_raw.tif")
 
-        #logging.info("dsm hillshading")
         #run_command(["gdaldem", "hillshade", output_folder+"dsm.tif", output_folder+"hillshade_dsm.tif", "-z", "1", "-s", "1", "-az", "315", "-alt", "45"])
 
-        logging.info("dsm slope")
-        run_command(["gdaldem", "slope", output_folder+"dsm.tif", output_folder+"slope_dsm.tif", "-s", "1"])
+        stages.append(command_stage("dsm slope",
+            ["gdaldem", "slope", output_folder+"dsm.tif", output_folder+"slope_dsm.tif", "-s", "1", *raster_formats.gdal_co_args("float32", threads)],
+            inputs=[output_folder+"dsm.tif"], outputs=[output_folder+"slope_dsm.tif"]))
 
         if compute_dsm_rayshading:
-            logging.info("ray shading")
-            compute_rayshading(output_folder+"dsm.tif", output_folder+"shadow.tif", light_altitude=15)
+            stages.append(Stage("compute_rayshading", partial(compute_rayshading, output_folder+"dsm.tif", output_folder+"shadow.tif", light_altitude=15, pixel_scale=scale, threads=threads),
+                                inputs=[output_folder+"dsm.tif"], outputs=[output_folder+"shadow.tif"],
+                                memory=raster_memory(output_folder+"dsm.tif", 10), cpu=threads, instrument=True))
 
     if process_dtm:
 
         if with_pdal_pipeline:
             # prepare PDAL pipeline config
-            logging.info("pipeline DTM")
-
             data = get_base_config()
             data.extend([
 
@@ -396,8 +762,10 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
     },
     {
         "type": "writers.gdal",
+        **raster_formats.pdal_writer_options("elevation", threads),
+        **grid_options,
         "filename": output_folder+"dtm_building.tif",
-        "resolution": 0.2,
+        "resolution": resolution,
         "output_type": "min"
     },
     {
@@ -413,44 +781,44 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
     {
         #keep min, 20 centimeter resolution
         "type": "writers.gdal",
+        **raster_formats.pdal_writer_options("elevation", threads),
+        **grid_options,
         "filename": output_folder+"dtm_raw.tif",
-        "resolution": 0.2,
+        "resolution": resolution,
         "output_type": "min"
     }
     ])
+            stages.append(Stage("pipeline DTM", partial(run_pdal_pipeline, data, tmp_folder+"p_dtm.json"),
+                                outputs=[output_folder+"dtm_building.tif", output_folder+"dtm_raw.tif"], memory=pdal_memory, cpu=threads))
 
-            # execute PDAL pipeline
-            with open("tmp/p_dtm.json", "w") as f: json.dump(data, f, indent=3)
-            run_command(["pdal", "pipeline", "tmp/p_dtm.json"])
-
-
-        logging.info("dtm slope")
-        run_command(["gdaldem", "slope", output_folder+"dtm_raw.tif", output_folder+"slope_dtm.tif", "-s", "1"])
+        stages.append(command_stage("dtm slope",
+            ["gdaldem", "slope", output_folder+"dtm_raw.tif", output_folder+"slope_dtm.tif", "-s", "1", *raster_formats.gdal_co_args("float32", threads)],
+            inputs=[output_folder+"dtm_raw.tif"], outputs=[output_folder+"slope_dtm.tif"]))
 
-        logging.info("dtm building slope")
-        run_command(["gdaldem", "slope", output_folder+"dtm_building.tif", output_folder+"slope_dtm_building.tif", "-s", "1"])
+        stages.append(command_stage("dtm building slope",
+            ["gdaldem", "slope", output_folder+"dtm_building.tif", output_folder+"slope_dtm_building.tif", "-s", "1", *raster_formats.gdal_co_args("float32", threads)],
+            inputs=[output_folder+"dtm_building.tif"], outputs=[output_folder+"slope_dtm_building.tif"]))
 
-        logging.info("fill dtm no data")
-        run_command(["gdal_fillnodata.py", "-md", "50", "-of", "GTiff", output_folder+"dtm_raw.tif", output_folder+"dtm.tif"])
-        os.remove(output_folder+"dtm_raw.tif")
+        stages.append(command_stage("fill dtm no data",
+            ["gdal_fillnodata.py", "-md", str(px(50)), *raster_formats.gdal_co_args(threads=threads), output_folder+"dtm_raw.tif", output_folder+"dtm.tif"],
+            inputs=[output_folder+"dtm_raw.tif"], outputs=[output_folder+"dtm.tif"], memory=raster_memory(output_folder+"dtm_raw.tif", 16)))
+        temporary.append(output_folder+"dtm_raw.tif")
 
-        logging.info("smooth dtm")
-        smooth(output_folder+"dtm.tif", output_folder+"dtm_smoothed.tif", 6)
-        #os.remove(output_folder+"dtm.tif")
+        stages.append(Stage("smooth", partial(smooth, output_folder+"dtm.tif", output_folder+"dtm_smoothed.tif", 6 / scale, threads),
+                            inputs=[output_folder+"dtm.tif"], outputs=[output_folder+"dtm_smoothed.tif"],
+                            memory=raster_memory(output_folder+"dtm.tif", 32), cpu=threads, instrument=True))
 
-        logging.info("make contours")
-        run_command(["gdal_contour", "-a", "elevation", "-i", "1", output_folder+"dtm_smoothed.tif", "-f", "GPKG", output_folder+"contours.gpkg"])
-        os.remove(output_folder+"dtm_smoothed.tif")
+        stages.append(Stage("make contours", partial(make_contours, output_folder+"dtm_smoothed.tif", output_folder+"contours.gpkg"),
+                            inputs=[output_folder+"dtm_smoothed.tif"], outputs=[output_folder+"contours.gpkg"]))
+        temporary.append(output_folder+"dtm_smoothed.tif")
 
-        logging.info("set contours type")
-        contour_type_field(output_folder+"contours.gpkg", "contour")
+        stages.append(Stage("contour_type_field", partial(contour_type_field, output_folder+"contours.gpkg", "contour"),
+                            inputs=[output_folder+"contours.gpkg"], outputs=[output_folder+"contours.gpkg"], instrument=True, unit="features"))
 
     if process_vegetation:
 
         if with_pdal_pipeline:
             # prepare PDAL pipeline config
-            logging.info("pipeline vegetation")
-
             data = get_base_config()
             data.extend([
         {
@@ -467,8 +835,10 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
         },
         {
             "type": "writers.gdal",
+            **raster_formats.pdal_writer_options("elevation", threads),
+            **grid_options,
             "filename": output_folder+"dsm_vegetation.tif",
-            "resolution": 0.2,
+            "resolution": resolution,
             "output_type": "max"
         },
 
@@ -479,32 +849,42 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
         },
         {
             "type": "writers.gdal",
+            **raster_formats.pdal_writer_options("mask", threads),
+            **grid_options,
             "filename": output_folder+"vegetation.tif",
             "dimension": "Z",
             "output_type": "max",
-            "resolution": 0.2
+            "resolution": resolution
         }
     ])
+            stages.append(Stage("pipeline vegetation", partial(run_pdal_pipeline, data, tmp_folder+"p_vegetation.json"),
+                                outputs=[output_folder+"dsm_vegetation.tif", output_folder+"vegetation.tif"], memory=pdal_memory, cpu=threads))
 
-            # execute PDAL pipeline
-            with open("tmp/p_vegetation.json", "w") as f: json.dump(data, f, indent=3)
-            run_command(["pdal", "pipeline", "tmp/p_vegetation.json"])
-
-        #logging.info("vegetation slope")
-        #run_command(["gdaldem", "slope", output_folder+"dsm_vegetation.tif", output_folder+"slope_vegetation.tif", "-s", "1"])
+        #run_command(["gdaldem", "slope", output_folder+"dsm_vegetation.tif", output_folder+"slope_vegetation.tif", "-s", "1", *raster_formats.gdal_co_args("float32")])
 
         #TODO vectorise ? To make blurry outline ?
 
-        logging.info("clean vegetation.tif")
-        sequential_buffer_tiff(output_folder+"vegetation.tif", output_folder+"vegetation_clean.tif", [-2, 2])
-        os.remove(output_folder+"vegetation.tif")
+        stages.append(Stage("clean vegetation", partial(sequential_buffer_tiff, output_folder+"vegetation.tif", output_folder+"vegetation_clean.tif", [-px(2, 0), px(2, 0)], threads),
+                            inputs=[output_folder+"vegetation.tif"], outputs=[output_folder+"vegetation_clean.tif"],
+                            memory=raster_memory(output_folder+"vegetation.tif", 20), cpu=threads, instrument=True))
+        temporary.append(output_folder+"vegetation.tif")
+
+    if process_dsm and process_dtm and process_vegetation:
+        # heights above the ground, computed block by block in a single pass, on the DSM grid
+        heights = [
+            (output_folder+"ndsm.tif", raster_algebra.normalised_dsm, "height"),
+            (output_folder+"canopy_height.tif", raster_algebra.canopy_height, "height"),
+            (output_folder+"canopy_height_bands.tif", raster_algebra.canopy_height_bands, "class"),
+        ]
+        height_inputs = {"dsm": output_folder+"dsm.tif", "dtm": output_folder+"dtm.tif",
+                         "dsm_vegetation": output_folder+"dsm_vegetation.tif", "vegetation": output_folder+"vegetation_clean.tif"}
+        stages.append(Stage("heights", partial(raster_algebra.raster_algebra, height_inputs, heights, threads),
+                            inputs=list(height_inputs.values()), outputs=[h[0] for h in heights], cpu=threads, instrument=True))
 
     if process_building:
 
         if with_pdal_pipeline:
             # prepare PDAL pipeline config
-            logging.info("pipeline building")
-
             data = get_base_config()
             data.extend([
         {
@@ -517,8 +897,10 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
         },
         {
             "type": "writers.gdal",
+            **raster_formats.pdal_writer_options("elevation", threads),
+            **grid_options,
             "filename": output_folder+"dsm_building.tif",
-            "resolution": 0.2,
+            "resolution": resolution,
             "output_type": "max"
         },
         {
@@ -527,30 +909,68 @@ def cartoHDprocess(input_lidar_data, output_folder, bounds = None, case = None):
         },
         {
             "type": "writers.gdal",
+            **raster_formats.pdal_writer_options("mask", threads),
+            **grid_options,
             "filename": output_folder+"building.tif",
             "dimension": "Z",
             "output_type": "max",
-            "resolution": 0.2
+            "resolution": resolution
         }
     ])
-
-            # execute PDAL pipeline
-            with open("tmp/p_building.json", "w") as f: json.dump(data, f, indent=3)
-            run_command(["pdal", "pipeline", "tmp/p_building.json"])
-
-
-        #logging.info("building slope")
-        #run_command(["gdaldem", "slope", output_folder+"dsm_building.tif", output_folder+"slope_building.tif", "-s", "1"])
-
-        logging.info("clean building.tif")
-        sequential_buffer_tiff(output_folder+"building.tif", output_folder+"building_clean.tif", [3, -3])
-        os.remove(output_folder+"building.tif")
-
-
-        logging.info("vectorise")
-        run_command(["gdal_polygonize.py", "-overwrite", output_folder+"building_clean.tif", "-f", "GPKG", output_folder+"building.gpkg"])
-        os.remove(output_folder+"building_clean.tif")
-
-        logging.info("simplify")
-        run_command(["ogr2ogr", "-f", "GPKG", "-overwrite", output_folder+"building_simplified.gpkg", output_folder+"building.gpkg", "-simplify", "0.5"])
-        os.remove(output_folder+"building.gpkg")
+            stages.append(Stage("pipeline building", partial(run_pdal_pipeline, data, tmp_folder+"p_building.json"),
+                                outputs=[output_folder+"dsm_building.tif", output_folder+"building.tif"], memory=pdal_memory, cpu=threads))
+
+        #run_command(["gdaldem", "slope", output_folder+"dsm_building.tif", output_folder+"slope_building.tif", "-s", "1", *raster_formats.gdal_co_args("float32")])
+
+        stages.append(Stage("clean building", partial(sequential_buffer_tiff, output_folder+"building.tif", output_folder+"building_clean.tif", [px(3, 0), -px(3, 0)], threads),
+                            inputs=[output_folder+"building.tif"], outputs=[output_folder+"building_clean.tif"],
+                            memory=raster_memory(output_folder+"building.tif", 20), cpu=threads, instrument=True))
+        temporary.append(output_folder+"building.tif")
+
+        stages.append(command_stage("vectorise",
+            ["gdal_polygonize.py", "-overwrite", output_folder+"building_clean.tif", "-f", "GPKG", output_folder+"building.gpkg"],
+            inputs=[output_folder+"building_clean.tif"], outputs=[output_folder+"building.gpkg"], items=lambda: perf.raster_pixels(output_folder+"building_clean.tif"), cpu=1))
+        temporary.append(output_folder+"building_clean.tif")
+
+        stages.append(command_stage("simplify",
+            ["ogr2ogr", "-f", "GPKG", "-overwrite", output_folder+"building_simplified.gpkg", output_folder+"building.gpkg", "-simplify", "0.5"],
+            inputs=[output_folder+"building.gpkg"], outputs=[output_folder+"building_simplified.gpkg"], unit="features", cpu=1))
+        temporary.append(output_folder+"building.gpkg")
+
+        if process_dtm:
+            # height, roof slope and area of each building
+            building_rasters = [output_folder+"dsm_building.tif", output_folder+"dtm.tif", output_folder+"slope_dtm_building.tif"]
+            stages.append(Stage("building attributes", partial(building_attributes, output_folder+"building_simplified.gpkg", *building_rasters),
+                                inputs=[output_folder+"building_simplified.gpkg", *building_rasters], outputs=[output_folder+"building_simplified.gpkg"],
+                                # the footprints, loaded at once, and the rasters of a window
+                                memory=lambda: 10 * perf.files_size([output_folder+"building_simplified.gpkg"]) + BUILDING_WINDOW_SIZE**2 * BUILDING_BYTES_PER_PIXEL,
+                                instrument=True, unit="features"))
+
+    # convert the raster products into Cloud Optimized GeoTIFF with overviews and compact encodings,
+    # once the stages reading them are completed
+    for product, resampling, encoding in RASTER_PRODUCTS:
+        path = output_folder + product
+        if not any(path in s.outputs for s in stages): continue
+        if encoding == "elevation": encoding = "elevation_cm" if quantize_elevation else None
+        stages.append(Stage("cog " + product, partial(to_cog, path, resampling, encoding, threads), inputs=[path], outputs=[path], cpu=threads))
+
+    # stages completed by a previous run
+    done = set()
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f: done = set(json.load(f))
+        if done: logging.info(f"Resume: {len(done)} stages already completed")
+
+    def on_done(name):
+        if not checkpoint_file: return
+        done.add(name)
+        with open(checkpoint_file + ".tmp", "w") as f: json.dump(sorted(done), f, indent=3)
+        os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+    try:
+        status = run_stages(stages, max_cpu=max_cpu, max_memory=max_memory, temporary=temporary, done=done, on_done=on_done)
+        # all stages completed: a new run starts from scratch
+        if checkpoint_file and os.path.exists(checkpoint_file): os.remove(checkpoint_file)
+        if save_inputs: incremental.save_manifest(input_lidar_data, output_folder)
+        return status
+    finally:
+        perf.save_report(report_file or output_folder+"report.json")
@@ -0,0 +1,239 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Only light modules are imported here. Each command imports the modules it needs,
+# so that the heavy dependencies (numpy, rasterio, geopandas, scipy, pdal) are loaded only when used.
+
+
+# job file parameters, with their default values
+JOB_DEFAULTS = {
+    "data_root": None,
+    "output_root": None,
+    "case": "FR",
+    "areas": [],
+    "bounds": None,
+    "download": False,
+    "max_workers": 1,
+    "max_cpu": None,
+    "max_memory": None,
+    "retries": 2,
+    "streaming": False,
+    "preview": None,
+    "quantize_elevation": False,
+}
+
+
+
+def parse_size(size):
+    """
+    Parse a memory size, as a number of bytes or a string with a K, M, G or T suffix, such as "32G".
+    """
+    if size is None or isinstance(size, (int, float)): return size
+    size = str(size).strip().upper().rstrip("B")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    if size and size[-1] in units: return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def load_job(path):
+    """
+    Load a job file, in TOML or JSON format, and complete it with the default values.
+
+    Parameters:
+        path (str): The job file path. Its format is detected from its extension.
+
+    Returns:
+        dict: The job parameters.
+    """
+    if path.endswith(".json"):
+        with open(path) as f: job = json.load(f)
+    else:
+        import tomllib
+        with open(path, "rb") as f: job = tomllib.load(f)
+
+    unknown = set(job) - set(JOB_DEFAULTS)
+    if unknown: raise ValueError(f"Unknown job parameters in {path}: {', '.join(sorted(unknown))}")
+    for k in ["data_root", "output_root"]:
+        if not job.get(k): raise ValueError(f"Missing job parameter in {path}: {k}")
+    job = {**JOB_DEFAULTS, **job}
+    job["max_memory"] = parse_size(job["max_memory"])
+    return job
+
+
+
+def cmd_download(args):
+    from process import download_area
+    job = load_job(args.job)
+    for area in args.areas or job["areas"]:
+        download_area(area, job["data_root"])
+
+
+def cmd_process(args):
+    if args.job:
+        if args.input or args.output: raise SystemExit("process: --input and --output are used without job file")
+        from process import run_batch
+        job = load_job(args.job)
+        # the command line options override the job parameters
+        for k in ["case", "bounds", "max_cpu", "preview"]:
+            if getattr(args, k) is not None: job[k] = getattr(args, k)
+        if args.max_memory is not None: job["max_memory"] = parse_size(args.max_memory)
+        if args.streaming: job["streaming"] = True
+        if args.quantize_elevation: job["quantize_elevation"] = True
+        state = run_batch(
+            args.areas or job["areas"], job["data_root"], job["output_root"], job["case"],
+            download=job["download"], bounds=job["bounds"], max_workers=job["max_workers"], max_cpu=job["max_cpu"],
+            max_memory=job["max_memory"], retries=job["retries"], streaming=job["streaming"],
+            preview=job["preview"], quantize_elevation=job["quantize_elevation"],
+        )
+        return 0 if all(s["status"] == "done" for s in state.values()) else 1
+
+    if not (args.input and args.output): raise SystemExit("process: give a job file, or --input and --output")
+    if args.areas: raise SystemExit("process: --areas is used with a job file")
+    from cartoHD import cartoHDprocess
+    cartoHDprocess(args.input, os.path.join(args.output, ""), bounds=args.bounds, case=args.case or JOB_DEFAULTS["case"],
+                   max_cpu=args.max_cpu, max_memory=parse_size(args.max_memory), streaming=args.streaming,
+                   preview=args.preview, quantize_elevation=args.quantize_elevation)
+
+
+def cmd_update(args):
+    from incremental import update_area
+    update_area(args.input, os.path.join(args.output, ""), case=args.case,
+                max_cpu=args.max_cpu, max_memory=parse_size(args.max_memory))
+
+
+def cmd_plan(args):
+    from planner import plan, format_plan
+    result = plan(args.input, bounds=args.bounds, resolution=args.resolution, max_memory=parse_size(args.max_memory),
+                  max_cpu=args.max_cpu, report_files=args.reports)
+    print(format_plan(result))
+    if args.json:
+        with open(args.json, "w") as f: json.dump(result, f, indent=3)
+
+
+def cmd_rayshade(args):
+    from cartoHD import compute_rayshading
+    compute_rayshading(args.input, args.output, light_azimuth=args.azimuth, light_altitude=args.altitude,
+                       ray_max_length=args.max_length)
+
+
+def cmd_tile(args):
+    from rasterio.enums import Resampling
+    from tiler.tiler import tile_raster_xyz, tile_terrain_rgb
+    if args.terrain:
+        tile_terrain_rgb(args.input, args.output, min_zoom=args.min_zoom, max_zoom=args.max_zoom, tile_size=args.tile_size,
+                         encoding=args.terrain, resampling=Resampling[args.resampling or "bilinear"], max_workers=args.max_workers)
+        return
+    tile_raster_xyz(args.input, args.output, min_zoom=args.min_zoom, max_zoom=args.max_zoom, tile_size=args.tile_size,
+                    resampling=Resampling[args.resampling or "nearest"], max_workers=args.max_workers)
+
+
+def cmd_vtile(args):
+    from tiler.vector_tiler import tile_vector_mvt
+    tile_vector_mvt(args.input, args.output, min_zoom=args.min_zoom, max_zoom=args.max_zoom,
+                    simplification=args.simplification, max_workers=args.max_workers)
+
+
+def cmd_benchmark(args):
+    from benchmark import run_benchmarks, BASELINE_FILE
+    regressions = run_benchmarks(args.names, args.sizes, args.repeat, args.baseline or BASELINE_FILE,
+                                 args.save_baseline, args.threshold)
+    return 1 if regressions else 0
+
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cartohd", description="Produce large scale and high definition maps from LiDAR data.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show debug messages.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("download", help="Download the LiDAR data of the areas of a job.")
+    p.add_argument("job", help="Job file, in TOML or JSON format.")
+    p.add_argument("--areas", nargs="+", help="Areas to download, instead of those of the job file.")
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser("process", help="Produce the map layers, for the areas of a job or for some LiDAR files. The options override the job parameters.")
+    p.add_argument("job", nargs="?", help="Job file, in TOML or JSON format.")
+    p.add_argument("--areas", nargs="+", help="Areas to process, instead of those of the job file.")
+    p.add_argument("--input", help="LiDAR files, as a glob pattern such as 'data/*.laz'. Used without job file.")
+    p.add_argument("--output", help="Output folder. Used without job file.")
+    p.add_argument("--case", help="Classification codes case: FR, BE or LU. FR by default.")
+    p.add_argument("--bounds", help="Bounding box to crop the data: '([xmin, xmax],[ymin, ymax])'.")
+    p.add_argument("--max-cpu", type=int, help="Number of cores to use.")
+    p.add_argument("--max-memory", help="Memory budget, such as 32G. The physical memory by default.")
+    p.add_argument("--streaming", action="store_true", help="Rasterise the points by chunks, for point clouds larger than the memory.")
+    p.add_argument("--preview", type=int, help="Preview factor, such as 5: decimated points and coarser resolution, to tune the parameters quickly.")
+    p.add_argument("--quantize-elevation", action="store_true", help="Store the elevations as int32 centimeters instead of float32 meters.")
+    p.set_defaults(func=cmd_process)
+
+    p = sub.add_parser("update", help="Update the map layers of a previous run after some LiDAR files were added or replaced.")
+    p.add_argument("input", help="LiDAR files, as a glob pattern such as 'data/*.laz'.")
+    p.add_argument("output", help="Output folder of the previous run.")
+    p.add_argument("--case", default="FR", help="Classification codes case: FR, BE or LU.")
+    p.add_argument("--max-cpu", type=int, help="Number of cores to use.")
+    p.add_argument("--max-memory", help="Memory budget, such as 32G. The physical memory by default.")
+    p.set_defaults(func=cmd_update)
+
+    p = sub.add_parser("plan", help="Estimate the time and memory of a process run from the LiDAR file headers, and recommend how to run it.")
+    p.add_argument("input", help="LiDAR files, as a glob pattern such as 'data/*.laz'.")
+    p.add_argument("--bounds", help="Bounding box to crop the data: '([xmin, xmax],[ymin, ymax])'.")
+    p.add_argument("--resolution", type=float, default=0.2, help="Pixel size, in meters.")
+    p.add_argument("--max-cpu", type=int, help="Number of cores to use.")
+    p.add_argument("--max-memory", help="Memory budget, such as 32G. The physical memory by default.")
+    p.add_argument("--reports", nargs="+", help="Run reports of previous runs, such as 'out/*/report.json', to calibrate the estimates.")
+    p.add_argument("--json", help="Save the plan, with the tiles bounds, to this JSON file.")
+    p.set_defaults(func=cmd_plan)
+
+    p = sub.add_parser("rayshade", help="Compute the shadow depth of a DSM.")
+    p.add_argument("input", help="Input DSM GeoTIFF file.")
+    p.add_argument("output", help="Output shadow GeoTIFF file.")
+    p.add_argument("--azimuth", type=float, default=315, help="Light azimuth, in degrees.")
+    p.add_argument("--altitude", type=float, default=30, help="Light altitude, in degrees.")
+    p.add_argument("--max-length", type=int, help="Maximum ray length.")
+    p.set_defaults(func=cmd_rayshade)
+
+    p = sub.add_parser("tile", help="Generate XYZ PNG tiles from a raster, on the Web Mercator tile grid.")
+    p.add_argument("input", help="Input GeoTIFF file.")
+    p.add_argument("output", help="Output tiles folder.")
+    p.add_argument("--min-zoom", type=int, default=13)
+    p.add_argument("--max-zoom", type=int, default=15)
+    p.add_argument("--tile-size", type=int, default=256)
+    p.add_argument("--resampling", help="Resampling method: nearest, bilinear, average... nearest by default, bilinear for terrain tiles.")
+    p.add_argument("--terrain", choices=["terrarium", "mapbox"], help="Encode the elevations as RGB without loss, for client side shading.")
+    p.add_argument("--max-workers", type=int, help="Number of threads rendering tiles.")
+    p.set_defaults(func=cmd_tile)
+
+    p = sub.add_parser("vtile", help="Generate vector tiles (MVT) of the contours and buildings.")
+    p.add_argument("input", help="Output folder of a process run, with contours.gpkg and building_simplified.gpkg.")
+    p.add_argument("output", help="Output tiles folder, or MBTiles file ending with .mbtiles.")
+    p.add_argument("--min-zoom", type=int, default=13)
+    p.add_argument("--max-zoom", type=int, default=16)
+    p.add_argument("--simplification", type=float, default=1, help="Simplification tolerance, in tile pixels.")
+    p.add_argument("--max-workers", type=int, help="Number of ogr2ogr processes run concurrently. The number of cores by default.")
+    p.set_defaults(func=cmd_vtile)
+
+    p = sub.add_parser("benchmark", help="Benchmark the processing hot paths on synthetic data.")
+    p.add_argument("names", nargs="*", help="Benchmarks to run. All by default.")
+    p.add_argument("--sizes", type=int, nargs="+", help="Sizes to run instead of the default ones.")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--baseline", help="Baseline JSON file.")
+    p.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    p.add_argument("--threshold", type=float, default=0.2, help="Relative increase flagged as regression.")
+    p.set_defaults(func=cmd_benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(funcName)s - %(message)s",
+    )
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
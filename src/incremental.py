@@ -0,0 +1,259 @@
+import glob
+import json
+import logging
+import math
+import os
+import shutil
+
+import las_header
+
+
+# Incremental update of the products of an area, when LiDAR files are added or replaced.
+# Only a window around the new files is processed again, and the results are spliced into the existing products.
+
+# file recording the LiDAR files used to produce the products of an output folder
+MANIFEST_FILE = "inputs.json"
+
+# the raster products, updated by splicing, are the ones of cartoHD.RASTER_PRODUCTS
+
+# vector products, updated by replacing the features of the updated extent: lines are clipped, polygons are taken by centroid
+VECTOR_PRODUCTS = {"contours.gpkg": "clip", "building_simplified.gpkg": "centroid"}
+
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def save_manifest(input_lidar_data, output_folder):
+    """
+    Record the LiDAR files used to produce the products of an output folder, with their size, date and bounds.
+
+    Parameters:
+        input_lidar_data (str): The LiDAR files, as a glob pattern.
+        output_folder (str): The output folder.
+    """
+    manifest = {}
+    for h in las_header.read_headers(input_lidar_data):
+        manifest[os.path.abspath(h["path"])] = {**file_signature(h["path"]), "bounds": h["bounds"][:4]}
+    with open(os.path.join(output_folder, MANIFEST_FILE), "w") as f: json.dump(manifest, f, indent=3)
+
+
+def changed_files(input_lidar_data, output_folder):
+    """
+    Return the headers of the LiDAR files which are new or changed since the products of an output folder were produced.
+    """
+    with open(os.path.join(output_folder, MANIFEST_FILE)) as f: manifest = json.load(f)
+    changed = []
+    for path in sorted(glob.glob(input_lidar_data)):
+        if manifest.get(os.path.abspath(path), {}).get("size") == file_signature(path)["size"] \
+           and manifest[os.path.abspath(path)]["mtime"] == file_signature(path)["mtime"]: continue
+        changed.append(las_header.read_header(path))
+    return changed
+
+
+def stage_halos(resolution=0.2, light_altitude=15, max_height=50):
+    """
+    Return the distance, in meters, up to which each processing chain spreads the effect of a change of the points.
+
+    The distances follow the processing parameters of cartoHDprocess: no data filling distance,
+    smoothing kernel (4 sigma), buffer distances and shadow length of the highest objects.
+
+    Parameters:
+        resolution (float): The pixel size.
+        light_altitude (float): The light altitude of the ray shading, in degrees.
+        max_height (float): The height of the highest objects, in meters, for the shadow length.
+
+    Returns:
+        dict: The distance of each processing chain, in meters.
+    """
+    return {
+        "dsm": 20 * resolution,
+        # the ray shading is computed with horizontal distances in pixels and elevations in meters
+        "shadow": 20 * resolution + max_height / math.tan(math.radians(light_altitude)) * resolution,
+        "dtm": 50 * resolution + 4 * 6 * resolution,
+        "vegetation": (2 + 2) * resolution,
+        "building": (3 + 3) * resolution,
+    }
+
+
+def snap_bounds(bounds, x0, y0, resolution):
+    """
+    Expand bounds to the pixel grid of origin (x0, y0).
+    """
+    xmin, ymin, xmax, ymax = bounds
+    return (
+        x0 + math.floor((xmin - x0) / resolution) * resolution,
+        y0 + math.floor((ymin - y0) / resolution) * resolution,
+        x0 + math.ceil((xmax - x0) / resolution) * resolution,
+        y0 + math.ceil((ymax - y0) / resolution) * resolution,
+    )
+
+
+def expand(bounds, distance):
+    return (bounds[0] - distance, bounds[1] - distance, bounds[2] + distance, bounds[3] + distance)
+
+
+
+def splice_raster(path, update_path, inner_bounds, resampling="AVERAGE"):
+    """
+    Replace the pixels of a raster within some bounds by those of an update raster on the same grid.
+    The raster is extended if the bounds go beyond it. The result is written as a Cloud Optimized GeoTIFF.
+
+    Parameters:
+        path (str): The raster to update.
+        update_path (str): The update raster, on the same pixel grid.
+        inner_bounds (tuple): The (xmin, ymin, xmax, ymax) bounds of the pixels to replace.
+        resampling (str): The overviews resampling method, see cartoHD.RASTER_PRODUCTS.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.windows import from_bounds, Window
+    import raster_formats
+    from cartoHD import to_cog
+
+    with rasterio.open(path) as src, rasterio.open(update_path) as upd:
+        if src.dtypes[0] != upd.dtypes[0] or src.res != upd.res:
+            raise ValueError(f"{update_path} has not the data type and resolution of {path}")
+        res = src.res[0]
+        # the update must be on the pixel grid of the raster: a fractional offset would shift the replaced pixels
+        for offset in [(upd.transform.c - src.transform.c) / res, (upd.transform.f - src.transform.f) / res]:
+            if abs(offset - round(offset)) > 1e-6:
+                raise ValueError(f"{update_path} is not on the pixel grid of {path}: offset of {offset} pixels")
+        left, bottom, right, top = src.bounds
+        inner = (max(inner_bounds[0], upd.bounds.left), max(inner_bounds[1], upd.bounds.bottom),
+                 min(inner_bounds[2], upd.bounds.right), min(inner_bounds[3], upd.bounds.top))
+        left, bottom, right, top = min(left, inner[0]), min(bottom, inner[1]), max(right, inner[2]), max(top, inner[3])
+        width, height = int(round((right - left) / res)), int(round((top - bottom) / res))
+
+        profile = src.profile
+        profile.update(driver="GTiff", width=width, height=height, transform=from_origin(left, top, res, res),
+                       **raster_formats.rasterio_options(src.dtypes[0]))
+        spliced_path = path + ".spliced.tif"
+        with rasterio.open(spliced_path, "w", **profile) as dst:
+            dst.scales, dst.offsets = src.scales, src.offsets
+            # copy the existing raster, by strips
+            col_off, row_off = int(round((src.bounds.left - left) / res)), int(round((top - src.bounds.top) / res))
+            if (width, height) != (src.width, src.height):
+                for _, window in dst.block_windows(1): dst.write(
+                    src.read(window=Window(window.col_off - col_off, window.row_off - row_off, window.width, window.height),
+                             boundless=True, fill_value=src.nodata if src.nodata is not None else 0), window=window)
+            else:
+                for _, window in src.block_windows(1): dst.write(src.read(window=window), window=window)
+
+            # copy the updated pixels, by strips
+            upd_window = from_bounds(*inner, transform=upd.transform).round_offsets().round_lengths()
+            dst_window = from_bounds(*inner, transform=dst.transform).round_offsets().round_lengths()
+            for r in range(0, int(upd_window.height), 1024):
+                h = min(1024, int(upd_window.height) - r)
+                data = upd.read(window=Window(upd_window.col_off, upd_window.row_off + r, upd_window.width, h))
+                dst.write(data, window=Window(dst_window.col_off, dst_window.row_off + r, dst_window.width, h))
+
+    os.replace(spliced_path, path)
+    to_cog(path, resampling)
+
+
+def splice_vector(path, update_path, inner_bounds, method):
+    """
+    Replace the features of a GPKG file within some bounds by those of an update file.
+
+    Parameters:
+        path (str): The GPKG file to update.
+        update_path (str): The GPKG file with the updated features.
+        inner_bounds (tuple): The (xmin, ymin, xmax, ymax) bounds of the features to replace.
+        method (str): "clip" to cut the features at the bounds, for lines such as contours,
+            or "centroid" to take the whole features whose centroid is within the bounds, for polygons.
+    """
+    import geopandas as gpd
+    import pandas as pd
+    from shapely.geometry import box
+
+    layer = gpd.list_layers(path)["name"][0]
+    old = gpd.read_file(path, layer=layer)
+    new = gpd.read_file(update_path, layer=gpd.list_layers(update_path)["name"][0])
+    inner = box(*inner_bounds)
+
+    if method == "clip":
+        old = old.set_geometry(old.geometry.difference(inner))
+        new = new.set_geometry(new.geometry.intersection(inner))
+    else:
+        old = old[~old.geometry.centroid.within(inner)]
+        new = new[new.geometry.centroid.within(inner)]
+    old = old[~old.geometry.is_empty]
+    new = new[~new.geometry.is_empty]
+
+    merged = gpd.GeoDataFrame(pd.concat([old, new.to_crs(old.crs)], ignore_index=True), crs=old.crs)
+    merged.to_file(path + ".spliced.gpkg", layer=layer, driver="GPKG")
+    os.replace(path + ".spliced.gpkg", path)
+    logging.info(f"{path}: {len(new)} features updated")
+
+
+
+def update_area(input_lidar_data, output_folder, case=None, light_altitude=15, max_height=50, **kwargs):
+    """
+    Update the products of an output folder after some LiDAR files were added or replaced.
+
+    The new and changed files are detected from the inputs manifest saved by cartoHDprocess.
+    Their footprint, extended by the distance up to which each processing chain spreads a change,
+    defines the pixels and features to replace. The processing runs on this extent, plus the same distance
+    of context, and the results are spliced into the existing rasters and GPKG files.
+
+    Parameters:
+        input_lidar_data (str): The LiDAR files, as a glob pattern.
+        output_folder (str): The output folder of a previous complete run, with trailing slash.
+        case (str): The case identifier, see cartoHDprocess.
+        light_altitude (float): The light altitude of the ray shading, in degrees.
+        max_height (float): The height of the highest objects, in meters, for the shadow length.
+        kwargs: Other cartoHDprocess parameters, such as max_cpu or max_memory. The elevation encoding is the one of the
+            existing products.
+
+    Returns:
+        list of str: The updated LiDAR files.
+    """
+    import rasterio
+    import raster_formats
+    from cartoHD import cartoHDprocess, RASTER_PRODUCTS
+
+    changed = changed_files(input_lidar_data, output_folder)
+    if not changed:
+        logging.info("No new or changed LiDAR file")
+        return []
+    logging.info(f"{len(changed)} new or changed LiDAR files")
+
+    # extent of the pixels and features to replace, and extent to process, on the grid of the existing rasters
+    with rasterio.open(output_folder + "dsm.tif") as src:
+        resolution = src.res[0]
+        x0, y0 = src.bounds.left, src.bounds.top
+        # same elevation encoding as the existing products: their splicing requires the same data type
+        kwargs["quantize_elevation"] = src.dtypes[0] == raster_formats.ENCODINGS["elevation_cm"]["dtype"]
+    halo = max(stage_halos(resolution, light_altitude, max_height).values())
+    footprint = las_header.union_bounds(changed)
+    inner = snap_bounds(expand(footprint, halo), x0, y0, resolution)
+    window = snap_bounds(expand(footprint, 2 * halo), x0, y0, resolution)
+    logging.info(f"Update window {window}, replaced extent {inner}")
+
+    # process the window, with the LiDAR files intersecting it only
+    update_folder = os.path.join(output_folder, "update", "")
+    inputs_folder = os.path.join(update_folder, "inputs")
+    shutil.rmtree(update_folder, ignore_errors=True)
+    os.makedirs(inputs_folder)
+    for h in las_header.read_headers(input_lidar_data):
+        if las_header.intersects(h["bounds"], window):
+            os.symlink(os.path.abspath(h["path"]), os.path.join(inputs_folder, os.path.basename(h["path"])))
+    cartoHDprocess(os.path.join(inputs_folder, "*" + os.path.splitext(changed[0]["path"])[1]), update_folder,
+                   bounds=las_header.format_bounds(window), case=case, grid_bounds=window, save_inputs=False, **kwargs)
+
+    # splice the results into the existing products
+    for product, resampling, _ in RASTER_PRODUCTS:
+        if os.path.exists(output_folder + product) and os.path.exists(update_folder + product):
+            logging.info(f"splice {product}")
+            splice_raster(output_folder + product, update_folder + product, inner, resampling)
+    for product, method in VECTOR_PRODUCTS.items():
+        if os.path.exists(output_folder + product) and os.path.exists(update_folder + product):
+            logging.info(f"splice {product}")
+            splice_vector(output_folder + product, update_folder + product, inner, method)
+
+    shutil.rmtree(update_folder)
+    save_manifest(input_lidar_data, output_folder)
+    return [h["path"] for h in changed]
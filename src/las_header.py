@@ -0,0 +1,99 @@
+import glob
+import struct
+
+
+# Reading of the public header block of LAS and LAZ files, without reading the points.
+# The header of a LAZ file is not compressed: it is read the same way.
+
+
+
+def read_header(path):
+    """
+    Read the header of a LAS or LAZ file.
+
+    Parameters:
+        path (str): The LAS or LAZ file path.
+
+    Returns:
+        dict: The header information: version, point format, compression, point count,
+            point count by return, scale, offset and bounds (xmin, ymin, xmax, ymax, zmin, zmax).
+    """
+    with open(path, "rb") as f: data = f.read(375)
+    if len(data) < 227 or data[:4] != b"LASF": raise ValueError(f"Not a LAS file: {path}")
+
+    major, minor = struct.unpack_from("<BB", data, 24)
+    point_format, point_length = struct.unpack_from("<BH", data, 104)
+    point_count = struct.unpack_from("<I", data, 107)[0]
+    by_return = list(struct.unpack_from("<5I", data, 111))
+    scale = struct.unpack_from("<3d", data, 131)
+    offset = struct.unpack_from("<3d", data, 155)
+    xmax, xmin, ymax, ymin, zmax, zmin = struct.unpack_from("<6d", data, 179)
+
+    # LAS 1.4: 64 bits point counts, used when the legacy ones are 0
+    if (major, minor) >= (1, 4) and len(data) >= 375:
+        count_64 = struct.unpack_from("<Q", data, 247)[0]
+        if count_64: point_count = count_64
+        by_return_64 = list(struct.unpack_from("<15Q", data, 255))
+        if any(by_return_64): by_return = by_return_64
+
+    return {
+        "path": path,
+        "version": f"{major}.{minor}",
+        # the two high bits of the point format are set for LAZ compressed points
+        "point_format": point_format & 0x3F,
+        "compressed": bool(point_format & 0xC0),
+        "point_length": point_length,
+        "point_count": point_count,
+        "points_by_return": by_return,
+        "scale": scale,
+        "offset": offset,
+        "bounds": (xmin, ymin, xmax, ymax, zmin, zmax),
+    }
+
+
+def read_headers(pattern):
+    """
+    Read the headers of all LAS or LAZ files matching a glob pattern.
+
+    Returns:
+        list of dict: The headers, sorted by file path.
+    """
+    return [read_header(path) for path in sorted(glob.glob(pattern))]
+
+
+def union_bounds(headers):
+    """
+    Return the 2D bounds (xmin, ymin, xmax, ymax) covering the bounds of several headers.
+    """
+    if not headers: raise ValueError("No LAS header")
+    return (
+        min(h["bounds"][0] for h in headers),
+        min(h["bounds"][1] for h in headers),
+        max(h["bounds"][2] for h in headers),
+        max(h["bounds"][3] for h in headers),
+    )
+
+
+def parse_bounds(bounds):
+    """
+    Parse bounds in PDAL format "([xmin, xmax],[ymin, ymax])" into a (xmin, ymin, xmax, ymax) tuple.
+    """
+    values = [float(v) for v in bounds.replace("(", "").replace(")", "").replace("[", "").replace("]", "").split(",")]
+    if len(values) < 4: raise ValueError(f"Invalid bounds: {bounds}")
+    xmin, xmax, ymin, ymax = values[:4]
+    return xmin, ymin, xmax, ymax
+
+
+def format_bounds(bounds):
+    """
+    Format (xmin, ymin, xmax, ymax) bounds in PDAL format "([xmin, xmax],[ymin, ymax])".
+    """
+    xmin, ymin, xmax, ymax = bounds
+    return f"([{xmin}, {xmax}],[{ymin}, {ymax}])"
+
+
+def intersects(b1, b2):
+    """
+    Check if two (xmin, ymin, xmax, ymax) bounds intersect.
+    """
+    return b1[0] <= b2[2] and b2[0] <= b1[2] and b1[1] <= b2[3] and b2[1] <= b1[3]
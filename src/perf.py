@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+# report of the current run. None when no report was started: stages are then only logged.
+_report = None
+
+# ru_maxrss is in kilobytes on linux, in bytes on macos
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# per-thread cpu time when the platform provides it, so that concurrent stages do not count each other
+_RUSAGE_STAGE = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+
+
+def _cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident set size of this process and of its waited-for children, in bytes.
+    """
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_rss, children_rss) * _MAXRSS_UNIT
+
+
+def files_size(paths):
+    """
+    Return the total size in bytes of some files. Missing files are ignored.
+
+    Parameters:
+        paths (list of str): The file paths.
+    """
+    total = 0
+    for path in paths or []:
+        if os.path.isfile(path): total += os.path.getsize(path)
+    return total
+
+
+def raster_pixels(path):
+    """
+    Return the number of pixels of a raster file, or None if it cannot be read.
+    """
+    try:
+        import rasterio
+        with rasterio.open(path) as src: return src.width * src.height * src.count
+    except Exception:
+        return None
+
+
+
+def start_report(name, **context):
+    """
+    Start a new run report. All stages executed afterwards are recorded into it.
+
+    Parameters:
+        name (str): The run name.
+        context: Any additional JSON serialisable information on the run (input data, parameters...).
+    """
+    global _report
+    _report = {
+        "name": name,
+        "started": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "context": context,
+        "stages": [],
+    }
+    _report["_t0"] = time.perf_counter()
+    return _report
+
+
+def add_stage_record(record):
+    """
+    Add a stage record to the current report, and log it.
+    """
+    rate = ""
+    if record.get("items") and record.get("wall_s"):
+        record["items_per_s"] = record["items"] / record["wall_s"]
+        rate = f", {record['items_per_s']:.0f} {record['unit']}/s"
+    rss = record.get("peak_rss_bytes", record.get("process_peak_rss_bytes", 0))
+    logging.info(f"{record['name']}: {record['wall_s']:.2f}s wall, {record['cpu_s']:.2f}s cpu, peak rss {rss / 2**20:.0f} MB{rate}")
+    if _report is not None: _report["stages"].append(record)
+
+
+@contextmanager
+def stage(name, inputs=None, outputs=None, unit="pixels"):
+    """
+    Context manager measuring a processing stage executed in this process.
+
+    The yielded dictionary is the stage record: the caller may set record["items"] to the number
+    of points or pixels processed. When it is not set and unit is "pixels", the pixel count of
+    the first output raster is used.
+
+    The resources of a stage running in this process cannot be separated from the ones of the stages running next to it.
+    The record gives:
+    - cpu_s: the cpu time of the calling thread only, without the threads the stage starts (GDAL, thread pools);
+    - process_cpu_s: the cpu time of the whole process during the stage, including the stages running concurrently;
+    - process_peak_rss_bytes: the peak memory of the whole process since its start, not of the stage.
+
+    Parameters:
+        name (str): The stage name.
+        inputs (list of str): The input files.
+        outputs (list of str): The output files.
+        unit (str): The unit of the processed items, "pixels" or "points".
+    """
+    record = {"name": name, "kind": "python", "unit": unit, "inputs": list(inputs or []), "outputs": list(outputs or [])}
+    record["input_bytes"] = files_size(record["inputs"])
+    usage0 = resource.getrusage(_RUSAGE_STAGE)
+    process_usage0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    try:
+        yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["wall_s"] = time.perf_counter() - t0
+        record["cpu_s"] = _cpu_seconds(resource.getrusage(_RUSAGE_STAGE)) - _cpu_seconds(usage0)
+        record["process_cpu_s"] = _cpu_seconds(resource.getrusage(resource.RUSAGE_SELF)) - _cpu_seconds(process_usage0)
+        record["process_peak_rss_bytes"] = peak_rss_bytes()
+        record["output_bytes"] = files_size(record["outputs"])
+        if record.get("items") is None and unit == "pixels" and record["outputs"]:
+            record["items"] = raster_pixels(record["outputs"][0])
+        add_stage_record(record)
+
+
+def save_report(path):
+    """
+    Save the current run report as JSON.
+
+    Parameters:
+        path (str): The output JSON file path.
+    """
+    if _report is None: return
+    report = {k: v for k, v in _report.items() if not k.startswith("_")}
+    report["wall_s"] = time.perf_counter() - _report["_t0"]
+    report["peak_rss_bytes"] = peak_rss_bytes()
+    with open(path, "w") as f: json.dump(report, f, indent=3)
+    logging.info(f"Run report saved to {path}")
@@ -0,0 +1,253 @@
+import glob
+import json
+import logging
+import math
+import os
+
+import las_header
+
+
+# Pre-flight planning of a cartoHDprocess run, from the LiDAR file headers only.
+# The time and memory of each stage are estimated from the number of points and pixels, with throughputs and
+# memory per item calibrated from the run reports of previous runs (see perf.py), or default values otherwise.
+
+
+# Stages of cartoHDprocess, by name of their record in the run reports:
+# unit of the processed items, number of runs per area, default throughput in items per second, and memory per item in bytes.
+STAGE_MODEL = {
+    "pdal pipeline": {"unit": "points", "runs": 4, "items_per_s": 1.5e6, "bytes_per_item": 80},
+    "rasterize streaming": {"unit": "points", "runs": 1, "items_per_s": 3e6, "bytes_per_item": 0},
+    "gdal_fillnodata.py": {"unit": "pixels", "runs": 2, "items_per_s": 5e6, "bytes_per_item": 16},
+    "gdaldem slope": {"unit": "pixels", "runs": 3, "items_per_s": 3e7, "bytes_per_item": 0},
+    "compute_rayshading": {"unit": "pixels", "runs": 1, "items_per_s": 2e4, "bytes_per_item": 10},
+    "smooth": {"unit": "pixels", "runs": 1, "items_per_s": 2e7, "bytes_per_item": 32},
+    "gdal_contour": {"unit": "pixels", "runs": 1, "items_per_s": 1e7, "bytes_per_item": 0},
+    "clean vegetation": {"unit": "pixels", "runs": 1, "items_per_s": 5e7, "bytes_per_item": 20},
+    "clean building": {"unit": "pixels", "runs": 1, "items_per_s": 5e7, "bytes_per_item": 20},
+    "gdal_polygonize.py": {"unit": "pixels", "runs": 1, "items_per_s": 5e6, "bytes_per_item": 0},
+    "heights": {"unit": "pixels", "runs": 1, "items_per_s": 5e7, "bytes_per_item": 0},
+    "gdal_translate": {"unit": "pixels", "runs": 13, "items_per_s": 2e7, "bytes_per_item": 0},
+}
+
+# rasters held in memory by the streaming rasterisation, in bytes per pixel: 5 float32 grids and 2 uint8 masks
+STREAMING_BYTES_PER_PIXEL = 5 * 4 + 2
+
+# side of the processing tiles is a multiple of this length, in meters
+TILE_STEP = 500
+
+# processing chains of cartoHDprocess running concurrently: DSM, DTM, vegetation and building.
+# Each stage writing rasters uses a quarter of the cores
+CHAINS = 4
+
+
+
+def calibrate(report_files):
+    """
+    Compute the throughput and memory per item of each stage from run reports.
+    The memory per item is measured for the external commands only: the default values are kept for the Python stages.
+
+    Parameters:
+        report_files (list of str): The run report JSON files, or glob patterns.
+
+    Returns:
+        dict: The calibrated stage model, STAGE_MODEL updated with the measured values.
+    """
+    measures = {}
+    for pattern in report_files or []:
+        for path in glob.glob(pattern):
+            with open(path) as f: report = json.load(f)
+            for r in report.get("stages", []):
+                if r.get("name") not in STAGE_MODEL or not r.get("items") or not r.get("wall_s") or r.get("status", "ok") != "ok": continue
+                m = measures.setdefault(r["name"], {"items": 0, "wall_s": 0, "bytes_per_item": None})
+                m["items"] += r["items"]
+                m["wall_s"] += r["wall_s"]
+                # the peak memory of an external command is its own. The one of a Python stage is the one of the whole
+                # process, with the stages before it and running next to it: its default memory per item is kept
+                if r.get("kind") == "command":
+                    m["bytes_per_item"] = max(m["bytes_per_item"] or 0, r.get("peak_rss_bytes", 0) / r["items"])
+
+    model = {name: dict(s) for name, s in STAGE_MODEL.items()}
+    for name, m in measures.items():
+        model[name].update(items_per_s=m["items"] / m["wall_s"], calibrated=True)
+        if m["bytes_per_item"] is not None: model[name]["bytes_per_item"] = m["bytes_per_item"]
+    logging.info(f"{len(measures)} stages calibrated from the run reports")
+    return model
+
+
+def available_memory():
+    """
+    Return the physical memory of the machine, in bytes, or None if it cannot be found.
+    """
+    try: return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError): return None
+
+
+def concurrent_runs(runs, memory, max_memory=None, max_cpu=None):
+    """
+    Return the number of runs of a stage executed at the same time, as scheduled by cartoHDprocess:
+    the runs of the processing chains are concurrent, within the cpu and memory budgets. A run larger than the memory
+    budget runs alone.
+    """
+    k = min(runs, CHAINS)
+    if max_cpu: k = min(k, max_cpu // max(1, max_cpu // CHAINS))
+    if max_memory and memory: k = min(k, int(max_memory // memory))
+    return max(1, k)
+
+
+def estimate(points, pixels, model, streaming=False, max_memory=None, max_cpu=None):
+    """
+    Estimate the time and peak memory of each stage of a run.
+
+    The runs of a stage in the different processing chains, such as the four PDAL pipelines, are executed concurrently
+    within the budgets: the peak memory of a stage is the memory of a run times the number of concurrent runs.
+    The stages of a kind are assumed to run after the stages of the previous kind, so that the time of a run is the sum
+    of the times of the stages. Without budget, all the runs of a stage are concurrent.
+
+    Parameters:
+        points (int): The number of points.
+        pixels (int): The number of pixels of each raster.
+        model (dict): The stage model, see STAGE_MODEL and calibrate().
+        streaming (bool): Whether the points are rasterised by chunks instead of the PDAL pipelines.
+        max_memory (int): The memory budget of the run, in bytes. Optional.
+        max_cpu (int): The number of cores of the run. Optional.
+
+    Returns:
+        dict: The estimated number of concurrent runs, time (s), memory of a run (bytes) and peak memory (bytes) of each stage.
+    """
+    stages = {}
+    for name, s in model.items():
+        if name == ("pdal pipeline" if streaming else "rasterize streaming"): continue
+        items = points if s["unit"] == "points" else pixels
+        memory = items * s["bytes_per_item"]
+        if name == "rasterize streaming": memory = max(memory, pixels * STREAMING_BYTES_PER_PIXEL)
+        concurrent = concurrent_runs(s["runs"], memory, max_memory, max_cpu)
+        stages[name] = {"items": items, "runs": s["runs"], "concurrent": concurrent,
+                        "time_s": math.ceil(s["runs"] / concurrent) * items / s["items_per_s"],
+                        "memory_bytes": memory, "peak_memory_bytes": memory * concurrent}
+    return stages
+
+
+def plan(input_lidar_data, bounds=None, resolution=0.2, max_memory=None, max_cpu=None, report_files=None):
+    """
+    Plan a cartoHDprocess run from the LiDAR file headers: estimate its time and memory, and recommend how to run it.
+
+    The stages are estimated as scheduled by cartoHDprocess within the memory budget, the concurrent stages such as the
+    PDAL pipelines adding up. The estimates hold only if the run is given this budget: it is returned as run_max_memory.
+    When a single stage of the whole area exceeds the memory budget, the streaming mode and a division into
+    square tiles of the largest fitting size are recommended. The number of tiles processed concurrently is the number
+    of tiles fitting together in the memory budget, within the cpu budget, each run being given its share of the budget.
+
+    Parameters:
+        input_lidar_data (str): The LiDAR files, as a glob pattern.
+        bounds (str): The bounding box to crop the data, e.g. "([xmin, xmax],[ymin, ymax])". Optional.
+        resolution (float): The pixel size.
+        max_memory (int): The memory budget, in bytes. The physical memory by default.
+        max_cpu (int): The number of cores. All by default.
+        report_files (list of str): Run reports of previous runs, or glob patterns, to calibrate the estimates.
+
+    Returns:
+        dict: The plan: area size, estimates of each stage, and recommended streaming mode, tile size, tiles bounds and workers.
+    """
+    headers = las_header.read_headers(input_lidar_data)
+    if not headers: raise ValueError(f"No LiDAR file found: {input_lidar_data}")
+    max_memory = max_memory or available_memory()
+    max_cpu = max_cpu or os.cpu_count() or 1
+    model = calibrate(report_files)
+
+    # area and points. With crop bounds, the points are assumed uniformly distributed in each file
+    extent = las_header.parse_bounds(bounds) if bounds else las_header.union_bounds(headers)
+    points = 0
+    for h in headers:
+        xmin, ymin, xmax, ymax = h["bounds"][:4]
+        area = max((xmax - xmin) * (ymax - ymin), 1e-9)
+        ix = max(0, min(xmax, extent[2]) - max(xmin, extent[0]))
+        iy = max(0, min(ymax, extent[3]) - max(ymin, extent[1]))
+        points += int(h["point_count"] * min(1, ix * iy / area))
+    width = int(math.floor((extent[2] - extent[0]) / resolution)) + 1
+    height = int(math.floor((extent[3] - extent[1]) / resolution)) + 1
+    pixels = width * height
+    density = points / max((extent[2] - extent[0]) * (extent[3] - extent[1]), 1e-9)
+
+    stages = estimate(points, pixels, model, max_memory=max_memory, max_cpu=max_cpu)
+    run_memory = max(s["memory_bytes"] for s in stages.values())
+    result = {
+        "files": len(headers),
+        "points": points,
+        "density": density,
+        "extent": extent,
+        "raster_size": [width, height],
+        "resolution": resolution,
+        "max_memory": max_memory,
+        "max_cpu": max_cpu,
+        "stages": stages,
+        "time_s": sum(s["time_s"] for s in stages.values()),
+        "peak_memory_bytes": max(s["peak_memory_bytes"] for s in stages.values()),
+        "run_max_memory": max_memory,
+        "streaming": False,
+        "tile_size": None,
+        "tiles": [],
+        "workers": 1,
+    }
+
+    # a stage larger than the budget runs alone, and exceeds it
+    if max_memory is None or run_memory <= max_memory:
+        return result
+
+    # the whole area does not fit in memory: streaming rasterisation, and tiles whose stages fit in the memory budget
+    stages = estimate(points, pixels, model, streaming=True, max_memory=max_memory, max_cpu=max_cpu)
+    run_memory = max(s["memory_bytes"] for s in stages.values())
+    result.update(stages=stages, time_s=sum(s["time_s"] for s in stages.values()),
+                  peak_memory_bytes=max(s["peak_memory_bytes"] for s in stages.values()), streaming=True)
+    if run_memory <= max_memory:
+        return result
+
+    # memory per square meter of the most demanding stage
+    per_m2 = run_memory / max((extent[2] - extent[0]) * (extent[3] - extent[1]), 1e-9)
+    side = max(TILE_STEP, int(math.sqrt(max_memory / per_m2) // TILE_STEP * TILE_STEP))
+    tile_points, tile_pixels = int(density * side * side), int(side / resolution) ** 2
+    tile_run_memory = max(s["memory_bytes"] for s in estimate(tile_points, tile_pixels, model, streaming=True).values())
+
+    tiles = []
+    y = extent[1]
+    while y < extent[3]:
+        x = extent[0]
+        while x < extent[2]:
+            tiles.append(las_header.format_bounds((x, y, min(x + side, extent[2]), min(y + side, extent[3]))))
+            x += side
+        y += side
+
+    # tiles processed concurrently, each run with its share of the budgets
+    workers = max(1, min(max_cpu, len(tiles), int(max_memory // max(tile_run_memory, 1))))
+    tile_stages = estimate(tile_points, tile_pixels, model, streaming=True, max_memory=max_memory // workers, max_cpu=max(1, max_cpu // workers))
+    result.update(
+        tile_size=side,
+        tiles=tiles,
+        tile_peak_memory_bytes=max(s["peak_memory_bytes"] for s in tile_stages.values()),
+        run_max_memory=max_memory // workers,
+        workers=workers,
+    )
+    return result
+
+
+def format_plan(result):
+    """
+    Format a plan as a human readable text.
+    """
+    gb = 2**30
+    lines = [
+        f"{result['files']} files, {result['points']:,} points ({result['density']:.1f} pts/m2), "
+        f"rasters of {result['raster_size'][0]}x{result['raster_size'][1]} pixels at {result['resolution']}m",
+    ]
+    for name, s in sorted(result["stages"].items(), key=lambda i: -i[1]["time_s"]):
+        lines.append(f"  {name:<22} {s['runs']:>2} x {s['items']:>14,} {s['time_s'] / 60:8.1f} min  "
+                     f"{s['concurrent']} x {s['memory_bytes'] / gb:7.2f} GB")
+    lines.append(f"Total {result['time_s'] / 3600:.1f} h, peak memory {result['peak_memory_bytes'] / gb:.1f} GB"
+                 + (f" for a budget of {result['max_memory'] / gb:.1f} GB" if result["max_memory"] else ""))
+    if result["tile_size"]:
+        lines.append(f"Recommended: streaming mode, {len(result['tiles'])} tiles of {result['tile_size']}m "
+                     f"({result['tile_peak_memory_bytes'] / gb:.1f} GB each), {result['workers']} workers")
+    else:
+        lines.append("Recommended: whole area at once, " + ("streaming mode" if result["streaming"] else "standard mode"))
+    if result["run_max_memory"]:
+        lines.append(f"Give each run a memory budget of {result['run_max_memory'] / gb:.1f} GB (max_memory), for the estimates to hold")
+    return "\n".join(lines)
@@ -1,5 +1,11 @@
 from cartoHD import run_command, cartoHDprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from planner import available_memory
+import json
 import os
+import shutil
+import time
 import logging
 
 
@@ -23,6 +29,22 @@ import logging
 """
 
 
+def download_area(area_name: str, data_root: str):
+    """
+    Downloads the LiDAR data files of an area, listed in the data_root/area_name.txt file, into the data_root/area_name folder.
+    Files already downloaded are not downloaded again.
+
+    Args:
+        area_name (str): The name of the area.
+        data_root (str): The root directory where LiDAR data is downloaded to.
+    """
+    download_dir = os.path.join(data_root, area_name)
+    download_list_file = os.path.join(data_root, f"{area_name}.txt")
+    logging.info("Downloading data...")
+    os.makedirs(download_dir, exist_ok=True)
+    run_command(["wget", "-i", download_list_file, "-nc", "-P", download_dir], unit="files")
+
+
 def process_area(
     area_name: str,
     data_root: str,
@@ -30,6 +52,12 @@ def process_area(
     case: str,
     bounds: str = None,
     download: bool = True,
+    max_cpu: int = None,
+    max_memory: int = None,
+    resume: bool = True,
+    streaming: bool = False,
+    preview: int = None,
+    quantize_elevation: bool = False,
 ):
     """
     Downloads LiDAR data for a specific area and runs the CartoHD processing pipeline.
@@ -51,27 +79,184 @@ def process_area(
                                 e.g., "([xmin, xmax],[ymin, ymax])". Defaults to None.
         download (bool, optional): If True, attempts to download the data using wget.
                                    Defaults to True.
+        max_cpu (int, optional): The number of cores to use. All by default.
+        max_memory (int, optional): The memory budget, in bytes. The physical memory by default.
+        resume (bool, optional): If True, the stages completed by a previous run are not executed again.
+                                 Defaults to True.
+        streaming (bool, optional): If True, the points are rasterised by chunks, for point clouds larger than the memory.
+                                    Defaults to False.
+        preview (int, optional): A preview factor, such as 5, to produce all layers quickly at a coarser resolution,
+                                 in the 'preview' subfolder of the area output folder. Defaults to None.
+        quantize_elevation (bool, optional): If True, the elevation products are stored as int32 centimeters.
+                                             Defaults to False.
     """
     logging.info(f"--- Processing area: {area_name} ---")
 
     download_dir = os.path.join(data_root, area_name)
-    download_list_file = os.path.join(data_root, f"{area_name}.txt")
 
-    if download:
-        logging.info("Downloading data...")
-        os.makedirs(download_dir, exist_ok=True)
-        run_command(["wget", "-i", download_list_file, "-nc", "-P", download_dir])
+    if download: download_area(area_name, data_root)
 
     input_lidar_data = os.path.join(download_dir, "*.laz")
     output_folder = os.path.join(output_root, area_name, "")  # Add trailing slash
+    if preview: output_folder = os.path.join(output_folder, "preview", "")
 
-    cartoHDprocess(input_lidar_data, output_folder, bounds=bounds, case=case)
+    cartoHDprocess(input_lidar_data, output_folder, bounds=bounds, case=case,
+                   max_cpu=max_cpu, max_memory=max_memory, streaming=streaming, preview=preview,
+                   quantize_elevation=quantize_elevation, tmp_folder=os.path.join(output_folder, "tmp", ""),
+                   checkpoint_file=os.path.join(output_folder, "checkpoint.json") if resume else None)
 
-    logging.info("Copying QGIS project file...")
-    run_command(["cp", "src/project_FR.qgz", output_folder])
+    # the QGIS project template is a convenience: the area is complete without it
+    template = os.path.join(os.path.dirname(os.path.abspath(__file__)), "project_FR.qgz")
+    if os.path.exists(template):
+        logging.info("Copying QGIS project file...")
+        shutil.copy(template, output_folder)
+    else:
+        logging.warning(f"QGIS project template not found: {template}")
     logging.info(f"--- Finished processing {area_name} ---")
 
 
+def _process_area_logged(*args, **kwargs):
+    # process an area in a worker process, with logging configured
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(processName)s - %(funcName)s - %(message)s",
+    )
+    process_area(*args, **kwargs)
+
+
+def run_batch(
+    areas: list,
+    data_root: str,
+    output_root: str,
+    case: str,
+    download: bool = True,
+    bounds: str = None,
+    max_workers: int = 2,
+    max_cpu: int = None,
+    max_memory: int = None,
+    retries: int = 2,
+    streaming: bool = False,
+    preview: int = None,
+    retry_delay: float = 60,
+    state_file: str = None,
+    quantize_elevation: bool = False,
+):
+    """
+    Processes several areas concurrently, and records their completion so that a restarted batch resumes where it stopped.
+
+    Each area runs in its own process, with its own temporary folder and a share of the global cpu and memory budgets.
+    A failed area is retried, resuming from its last completed stage, and does not stop the other areas.
+    When a worker process dies, for example killed by the system when out of memory, the areas running at that time
+    are counted as failed attempts and the workers are restarted.
+
+    Args:
+        areas (list of str): The names of the areas to process.
+        data_root (str): The root directory where LiDAR data is stored or will be downloaded to.
+        output_root (str): The root directory where the processed output will be saved.
+        case (str): The case identifier for processing (e.g., "FR" for France).
+        download (bool, optional): If True, attempts to download the data using wget. Defaults to True.
+        bounds (str, optional): A bounding box to crop the data of all areas. Defaults to None.
+        max_workers (int, optional): The number of areas processed concurrently. Defaults to 2.
+        max_cpu (int, optional): The total number of cores to use. All by default.
+        max_memory (int, optional): The total memory budget, in bytes. The physical memory by default.
+        retries (int, optional): The number of retries of a failed area. Defaults to 2.
+        streaming (bool, optional): If True, the points are rasterised by chunks, for point clouds larger than the memory.
+        preview (int, optional): A preview factor, such as 5, to produce all layers quickly at a coarser resolution.
+            The batch state is then recorded separately from the one of the full resolution runs.
+        retry_delay (float, optional): The delay before the first retry, in seconds, doubled at each retry. Defaults to 60.
+        state_file (str, optional): The JSON file recording the state of each area. output_root/batch_state.json by default,
+            output_root/batch_state_preview.json in preview mode.
+        quantize_elevation (bool, optional): If True, the elevation products are stored as int32 centimeters.
+
+    Returns:
+        dict: The state of each area.
+    """
+    state_file = state_file or os.path.join(output_root, "batch_state_preview.json" if preview else "batch_state.json")
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file) as f: state = json.load(f)
+
+    def save_state():
+        os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+        with open(state_file + ".tmp", "w") as f: json.dump(state, f, indent=3)
+        os.replace(state_file + ".tmp", state_file)
+
+    # share the budgets between the workers
+    max_cpu = max_cpu or os.cpu_count() or 1
+    worker_cpu = max(1, max_cpu // max_workers)
+    max_memory = max_memory or available_memory()
+    worker_memory = max_memory // max_workers if max_memory else None
+
+    # areas to process, with their attempt number
+    queue = []
+    for area in areas:
+        if state.get(area, {}).get("status") == "done":
+            logging.info(f"{area} already done")
+            continue
+        state[area] = {"status": "pending", "attempts": state.get(area, {}).get("attempts", 0)}
+        queue.append(area)
+    save_state()
+
+    def fail(area, e):
+        state[area]["error"] = str(e)
+        if state[area]["attempts"] <= retries:
+            delay = retry_delay * 2 ** (state[area]["attempts"] - 1)
+            logging.warning(f"{area} failed, retry in {delay:.0f}s: {e}")
+            state[area]["status"] = "pending"
+            state[area]["retry_at"] = time.time() + delay
+            queue.append(area)
+        else:
+            logging.error(f"{area} failed: {e}")
+            state[area]["status"] = "failed"
+
+    running = {}
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        while queue or running:
+            # launch the areas whose retry delay is over
+            for area in list(queue):
+                if len(running) >= max_workers: break
+                if state[area].get("retry_at", 0) > time.time(): continue
+                queue.remove(area)
+                state[area]["status"] = "running"
+                state[area]["attempts"] += 1
+                future = executor.submit(_process_area_logged, area, data_root, output_root, case,
+                                         bounds=bounds, download=download, max_cpu=worker_cpu, max_memory=worker_memory, streaming=streaming,
+                                         preview=preview, quantize_elevation=quantize_elevation)
+                running[future] = area
+            save_state()
+
+            if not running:
+                time.sleep(1)
+                continue
+
+            finished, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+            broken = None
+            for future in finished:
+                area = running.pop(future)
+                try:
+                    future.result()
+                    state[area] = {"status": "done", "attempts": state[area]["attempts"]}
+                except BrokenProcessPool as e:
+                    broken = e
+                    fail(area, e)
+                except Exception as e:
+                    fail(area, e)
+
+            # a worker died: the pool cannot run anything anymore. The running areas fail and a new pool is started
+            if broken:
+                logging.warning(f"Worker process died, restarting the workers: {broken}")
+                for future, area in running.items(): fail(area, broken)
+                running = {}
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            save_state()
+    finally:
+        executor.shutdown(wait=True)
+
+    return state
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
@@ -87,6 +272,6 @@ if __name__ == "__main__":
     # 3. List the area(s) to process. This should match the subfolder name in lidar_data_root.
     areas_to_process = ["colinesprovence"]
 
-    for area in areas_to_process:
-        # 4. Call the processing function. Set download=False since the file is local.
-        process_area(area, lidar_data_root, map_output_root, case="FR", download=False)
+    # 4. Process the areas, two at a time. Set download=False since the files are local.
+    # When restarted, the batch resumes where it stopped: completed areas and stages are not processed again.
+    run_batch(areas_to_process, lidar_data_root, map_output_root, case="FR", download=False, max_workers=2)
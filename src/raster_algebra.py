@@ -0,0 +1,122 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import raster_formats
+
+
+# Block-wise raster algebra over the raster products.
+# Several output rasters are computed in one pass over the inputs: each block of the inputs is read once,
+# only when an expression uses it, and all expressions are evaluated on it before the next block.
+# No full size array is ever allocated. The blocks are processed by several threads.
+
+# size of the processed blocks, in pixels: a multiple of the internal tile size of the outputs
+ALGEBRA_BLOCK_SIZE = 4 * raster_formats.BLOCK_SIZE
+
+# height bands of the vegetation, in meters: class 1 below 2m, 2 from 2m to 5m, etc.
+HEIGHT_BANDS = [2, 5, 10, 20]
+
+
+
+class _Block(dict):
+    # the values of the inputs on a block, read on first access
+    def __init__(self, read):
+        super().__init__()
+        self._read = read
+
+    def __missing__(self, name):
+        self[name] = values = self._read(name)
+        return values
+
+
+def raster_algebra(inputs, outputs, max_workers=None, block_size=ALGEBRA_BLOCK_SIZE):
+    """
+    Compute rasters from expressions over other rasters, block by block.
+
+    All inputs are on the same grid, the one of the outputs: each block is read with the same window in all of them.
+
+    Parameters:
+        inputs (dict): The input rasters, by name: {name: path}.
+        outputs (list of tuple): The output rasters, as (path, expression, encoding) tuples. The expression is a function
+            of a dictionary of the physical values of the inputs on a block, by name, as float32 masked arrays,
+            returning a masked array. The encoding is one of raster_formats.ENCODINGS, masked pixels being no data.
+            All inputs must be on the same grid, or a ValueError is raised.
+        max_workers (int): The number of threads, also used to compress the outputs. Default of ThreadPoolExecutor, and all cores for the compression.
+        block_size (int): The size of the blocks, in pixels.
+
+    Returns:
+        int: The number of pixels of each output.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    names = list(inputs)
+    with rasterio.open(inputs[names[0]]) as ref:
+        profile = ref.profile
+        transform, width, height = ref.transform, ref.width, ref.height
+    for name in names[1:]:
+        with rasterio.open(inputs[name]) as src:
+            if src.transform != transform or src.shape != (height, width):
+                raise ValueError(f"{inputs[name]} is not on the grid of {inputs[names[0]]}")
+
+    # one handle per thread and input: rasterio datasets cannot be shared between threads
+    local = threading.local()
+    opened = []
+    def dataset(name):
+        if not hasattr(local, "datasets"): local.datasets = {}
+        if name not in local.datasets:
+            local.datasets[name] = rasterio.open(inputs[name])
+            opened.append(local.datasets[name])
+        return local.datasets[name]
+
+    # the outputs, written by one thread at a time
+    lock = threading.Lock()
+    destinations = []
+    for path, _, encoding in outputs:
+        e = raster_formats.ENCODINGS[encoding]
+        p = {**profile, "driver": "GTiff", "count": 1, "dtype": e["dtype"], "nodata": e["nodata"], **raster_formats.rasterio_options(e["dtype"], max_workers or "ALL_CPUS")}
+        dst = rasterio.open(path, "w", **p)
+        dst.scales, dst.offsets = (e["scale"],), (e["offset"],)
+        destinations.append(dst)
+
+    def process(window):
+        block = _Block(lambda name: raster_formats.read_values(dataset(name), window=window))
+        results = [raster_formats.encode(expression(block), encoding) for _, expression, encoding in outputs]
+        with lock:
+            for dst, data in zip(destinations, results): dst.write(data, 1, window=window)
+
+    windows = [Window(col, row, min(block_size, width - col), min(block_size, height - row))
+               for row in range(0, height, block_size) for col in range(0, width, block_size)]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # consume the results, to raise the errors
+            for _ in executor.map(process, windows): pass
+    finally:
+        for dst in destinations: dst.close()
+        for src in opened: src.close()
+
+    logging.info(f"{len(outputs)} rasters computed, {len(windows)} blocks of {width}x{height} pixels")
+    return width * height
+
+
+
+# expressions of the derived layers
+
+def normalised_dsm(v):
+    """Height of the surface above the ground."""
+    import numpy as np
+    return np.ma.clip(v["dsm"] - v["dtm"], 0, None)
+
+
+def canopy_height(v):
+    """Height of the vegetation above the ground, within the vegetation mask."""
+    import numpy as np
+    height = np.ma.clip(v["dsm_vegetation"] - v["dtm"], 0, None)
+    return np.ma.masked_where(np.ma.getmaskarray(v["vegetation"]), height)
+
+
+def canopy_height_bands(v):
+    """Height band of the vegetation, see HEIGHT_BANDS: 1 for the lowest band."""
+    import numpy as np
+    height = canopy_height(v)
+    return np.ma.masked_array(np.digitize(height.filled(0), HEIGHT_BANDS) + 1, np.ma.getmaskarray(height))
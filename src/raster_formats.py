@@ -0,0 +1,166 @@
+import os
+
+
+# Creation options of the raster outputs.
+# All rasters are internally tiled and compressed with a predictor, using all cores unless a number of threads is given.
+# The final products are converted to Cloud Optimized GeoTIFF, with overviews.
+
+# compression algorithm. Use DEFLATE with a GDAL built without ZSTD.
+COMPRESS = os.environ.get("CARTOHD_COMPRESS", "ZSTD")
+# size of the internal tiles, in pixels
+BLOCK_SIZE = 512
+
+
+
+def is_float(dtype):
+    return str(dtype).startswith("float")
+
+
+def predictor(dtype):
+    """
+    Return the TIFF predictor suited to a data type: floating point predictor for floats, horizontal differencing otherwise.
+    """
+    return 3 if is_float(dtype) else 2
+
+
+def gtiff_options(dtype="float64", threads="ALL_CPUS"):
+    """
+    Return the GTiff creation options for a data type, as a dictionary.
+
+    Parameters:
+        dtype (str): The raster data type.
+        threads (int or str): The number of compression threads, or "ALL_CPUS".
+    """
+    return {
+        "TILED": "YES",
+        "BLOCKXSIZE": str(BLOCK_SIZE),
+        "BLOCKYSIZE": str(BLOCK_SIZE),
+        "COMPRESS": COMPRESS,
+        "PREDICTOR": str(predictor(dtype)),
+        "NUM_THREADS": str(threads),
+        "BIGTIFF": "IF_SAFER",
+    }
+
+
+def gdal_co_args(dtype="float64", threads="ALL_CPUS"):
+    """
+    Return the GTiff creation options for a data type, as GDAL command line arguments.
+    """
+    args = ["-of", "GTiff"]
+    for k, v in gtiff_options(dtype, threads).items(): args += ["-co", f"{k}={v}"]
+    return args
+
+
+def pdal_gdalopts(dtype="float64", threads="ALL_CPUS"):
+    """
+    Return the GTiff creation options for a data type, as a PDAL writers.gdal 'gdalopts' value.
+    """
+    return ",".join(f"{k}={v}" for k, v in gtiff_options(dtype, threads).items())
+
+
+def pdal_writer_options(encoding, threads="ALL_CPUS"):
+    """
+    Return the PDAL writers.gdal options to write a raster with an encoding of ENCODINGS: data type, no data value and creation options.
+    """
+    e = ENCODINGS[encoding]
+    data_type = {"float32": "float", "float64": "double"}.get(e["dtype"], e["dtype"])
+    return {"data_type": data_type, "nodata": e["nodata"], "gdalopts": pdal_gdalopts(e["dtype"], threads)}
+
+
+def rasterio_options(dtype="float64", threads="ALL_CPUS"):
+    """
+    Return the GTiff creation options for a data type, as rasterio.open keyword arguments.
+    """
+    options = {k.lower(): v for k, v in gtiff_options(dtype, threads).items()}
+    options.update(tiled=True, blockxsize=BLOCK_SIZE, blockysize=BLOCK_SIZE, predictor=predictor(dtype))
+    return options
+
+
+def cog_args(dtype="float64", resampling="AVERAGE", threads="ALL_CPUS"):
+    """
+    Return the GDAL command line arguments to write a Cloud Optimized GeoTIFF with overviews.
+
+    Parameters:
+        dtype (str): The raster data type.
+        resampling (str): The overviews resampling method. Use NEAREST or MODE for classes and masks.
+        threads (int or str): The number of compression threads, or "ALL_CPUS".
+    """
+    options = {
+        "BLOCKSIZE": str(BLOCK_SIZE),
+        "COMPRESS": COMPRESS,
+        "PREDICTOR": "FLOATING_POINT" if is_float(dtype) else "STANDARD",
+        "NUM_THREADS": str(threads),
+        "BIGTIFF": "IF_SAFER",
+        "OVERVIEWS": "AUTO",
+        "OVERVIEW_RESAMPLING": resampling,
+    }
+    args = ["-of", "COG"]
+    for k, v in options.items(): args += ["-co", f"{k}={v}"]
+    return args
+
+
+
+# Encodings of the raster products: data type, no data value, and scale and offset from the stored values to the physical values.
+# - mask: 1 for the pixels of the mask, 0 elsewhere
+# - distance: shadow depth distance, in pixels
+# - slope: slope in degrees, with 0.5 degree precision
+# - hillshade: shading value, from 1 to 255
+# - elevation: elevation in meters
+# - elevation_cm: elevation in meters, quantised to centimeters
+# - height: height above the ground in meters, with 10 centimeters precision
+# - class: class number, from 1 to 254
+ENCODINGS = {
+    "mask": {"dtype": "uint8", "nodata": 0, "scale": 1, "offset": 0},
+    "distance": {"dtype": "uint16", "nodata": 0, "scale": 1, "offset": 0},
+    "slope": {"dtype": "uint8", "nodata": 255, "scale": 0.5, "offset": 0},
+    "hillshade": {"dtype": "uint8", "nodata": 0, "scale": 1, "offset": 0},
+    "elevation": {"dtype": "float32", "nodata": -9999, "scale": 1, "offset": 0},
+    "elevation_cm": {"dtype": "int32", "nodata": -2147483648, "scale": 0.01, "offset": 0},
+    "height": {"dtype": "uint16", "nodata": 65535, "scale": 0.1, "offset": 0},
+    "class": {"dtype": "uint8", "nodata": 0, "scale": 1, "offset": 0},
+}
+
+
+
+def encode(values, encoding):
+    """
+    Encode physical values with an encoding of ENCODINGS.
+
+    Parameters:
+        values (np.ma.MaskedArray): The physical values. Masked pixels are set to the no data value.
+        encoding (str): The encoding name.
+
+    Returns:
+        np.ndarray: The stored values.
+    """
+    import numpy as np
+    e = ENCODINGS[encoding]
+    data = (np.ma.getdata(values) - e["offset"]) / e["scale"]
+    if not is_float(e["dtype"]):
+        # round and clip to the type range, excluding the no data value
+        info = np.iinfo(e["dtype"])
+        lo = info.min + 1 if e["nodata"] == info.min else info.min
+        hi = info.max - 1 if e["nodata"] == info.max else info.max
+        data = np.clip(np.rint(np.nan_to_num(data)), lo, hi)
+    return np.where(np.ma.getmaskarray(values), e["nodata"], data).astype(e["dtype"])
+
+
+def read_values(src, band=1, dtype="float32", **kwargs):
+    """
+    Read the physical values of a raster band, whatever its encoding: the scale and offset are applied, and no data pixels are masked.
+
+    Parameters:
+        src (rasterio.DatasetReader): The open raster.
+        band (int): The band number.
+        dtype (str): The data type of the returned values.
+        kwargs: Other rasterio read arguments, such as window, out_shape or resampling.
+
+    Returns:
+        np.ma.MaskedArray: The values.
+    """
+    data = src.read(band, masked=True, **kwargs)
+    values = data.astype(dtype)
+    scale, offset = src.scales[band - 1], src.offsets[band - 1]
+    if scale != 1: values *= scale
+    if offset != 0: values += offset
+    return values
@@ -0,0 +1,146 @@
+import json
+import logging
+import math
+
+import las_header
+import raster_formats
+
+
+# Streaming rasterisation of point clouds.
+# The points are read by fixed size chunks with the PDAL python bindings, and accumulated into preallocated grids:
+# the memory used is bounded by the raster size, whatever the number of points.
+# All products are computed in a single reading of the points.
+
+
+
+def product(filename, output_type, classes=None, exclude=None):
+    """
+    Define a raster product of the streaming rasterisation.
+
+    Parameters:
+        filename (str): The output GeoTIFF file.
+        output_type (str): "min" or "max" of the point elevations in each pixel, or "mask" for 1 where there is a point.
+        classes (list of (int, int)): The classification ranges of the points to keep, bounds included. All by default.
+        exclude (list of (int, int)): The classification ranges of the points to ignore.
+    """
+    if output_type not in ("min", "max", "mask"): raise ValueError(f"Unknown output type: {output_type}")
+    return {"filename": filename, "output_type": output_type, "classes": classes, "exclude": exclude or []}
+
+
+def raster_grid(headers, resolution, bounds=None, grid_bounds=None):
+    """
+    Compute the grid of the output rasters: its bounds are the grid bounds if given, the crop bounds if given,
+    the bounds of the point clouds otherwise.
+
+    Returns:
+        (xmin, ymax, width, height): The grid top left corner and size, in pixels.
+    """
+    if grid_bounds:
+        xmin, ymin, xmax, ymax = grid_bounds
+        return xmin, ymax, int(round((xmax - xmin) / resolution)), int(round((ymax - ymin) / resolution))
+    xmin, ymin, xmax, ymax = las_header.parse_bounds(bounds) if bounds else las_header.union_bounds(headers)
+    width = int(math.floor((xmax - xmin) / resolution)) + 1
+    height = int(math.floor((ymax - ymin) / resolution)) + 1
+    return xmin, ymin + height * resolution, width, height
+
+
+def grids_memory(width, height, products):
+    """
+    Return the memory used by the grids of the streaming rasterisation, in bytes.
+    """
+    return width * height * sum(1 if p["output_type"] == "mask" else 4 for p in products)
+
+
+def _select(classification, p):
+    import numpy as np
+    keep = np.ones(classification.shape, dtype=bool)
+    if p["classes"]:
+        keep[:] = False
+        for lo, hi in p["classes"]: keep |= (classification >= lo) & (classification <= hi)
+    for lo, hi in p["exclude"]: keep &= ~((classification >= lo) & (classification <= hi))
+    return keep
+
+
+def rasterize_streaming(input_lidar_data, products, resolution=0.2, bounds=None, chunk_size=1_000_000, grid_bounds=None, decimation=1, threads="ALL_CPUS"):
+    """
+    Rasterise point clouds into several min, max or mask rasters, reading the points by chunks.
+
+    Each point is binned into the pixel containing it: unlike PDAL writers.gdal, no search radius is used.
+
+    Parameters:
+        input_lidar_data (str): The LiDAR files, as a glob pattern.
+        products (list of dict): The rasters to produce, see product().
+        resolution (float): The pixel size.
+        bounds (str): The bounding box to crop the data, e.g. "([xmin, xmax],[ymin, ymax])". Optional.
+        chunk_size (int): The number of points read at once.
+        grid_bounds (tuple): The (xmin, ymin, xmax, ymax) bounds of the output rasters. Optional.
+        decimation (int): Keep one point out of this number, as PDAL filters.decimation.
+        threads (int or str): The number of threads compressing the rasters, or "ALL_CPUS".
+
+    Returns:
+        int: The number of points read.
+    """
+    import numpy as np
+    import pdal
+    import rasterio
+    from rasterio.transform import from_origin
+
+    headers = las_header.read_headers(input_lidar_data)
+    if not headers: raise ValueError(f"No LiDAR file found: {input_lidar_data}")
+    x0, y0, width, height = raster_grid(headers, resolution, bounds, grid_bounds)
+    logging.info(f"Grid of {width}x{height} pixels, {grids_memory(width, height, products) / 2**20:.0f} MB for {len(products)} rasters")
+
+    # preallocated grids, flattened
+    grids = []
+    for p in products:
+        if p["output_type"] == "mask": grids.append(np.zeros(width * height, dtype=np.uint8))
+        else: grids.append(np.full(width * height, np.inf if p["output_type"] == "min" else -np.inf, dtype=np.float32))
+
+    # skip the files outside the crop bounds
+    extent = (x0, y0 - height * resolution, x0 + width * resolution, y0)
+    headers = [h for h in headers if las_header.intersects(h["bounds"], extent)]
+
+    crs = None
+    n = 0
+    for h in headers:
+        pipeline = pdal.Pipeline(json.dumps([{"type": "readers.las", "filename": h["path"]}]))
+        if crs is None:
+            srs = pipeline.quickinfo.get("readers.las", {}).get("srs", {})
+            crs = srs.get("compoundwkt") or srs.get("wkt") or None
+
+        for points in pipeline.iterator(chunk_size=chunk_size):
+            first = n
+            n += len(points)
+            # keep the points whose index is a multiple of the decimation step, across chunks
+            if decimation > 1: points = points[-first % decimation::decimation]
+            col = np.floor((points["X"] - x0) / resolution).astype(np.int64)
+            row = np.floor((y0 - points["Y"]) / resolution).astype(np.int64)
+            inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+            index = row * width + col
+            z = points["Z"].astype(np.float32)
+            classification = points["Classification"]
+
+            for p, grid in zip(products, grids):
+                keep = inside & _select(classification, p)
+                if p["output_type"] == "mask": grid[index[keep]] = 1
+                elif p["output_type"] == "min": np.minimum.at(grid, index[keep], z[keep])
+                else: np.maximum.at(grid, index[keep], z[keep])
+        logging.info(f"{h['path']}: {n} points read")
+
+    # write the rasters
+    transform = from_origin(x0, y0, resolution, resolution)
+    for p, grid in zip(products, grids):
+        encoding = "mask" if p["output_type"] == "mask" else "elevation"
+        e = raster_formats.ENCODINGS[encoding]
+        grid = grid.reshape(height, width)
+        # pixels without point: no data, set in place to avoid a full size copy
+        if encoding == "elevation": grid[np.isinf(grid)] = e["nodata"]
+        with rasterio.open(
+            p["filename"], "w", driver="GTiff",
+            height=height, width=width, count=1, dtype=e["dtype"], nodata=e["nodata"],
+            crs=crs, transform=transform,
+            **raster_formats.rasterio_options(e["dtype"], threads)
+        ) as dst:
+            dst.write(grid, 1)
+
+    return n
@@ -0,0 +1,166 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable, Union
+
+import perf
+
+
+
+@dataclass
+class Stage:
+    """
+    A processing stage, with the files it reads and writes.
+
+    Attributes:
+        name (str): The stage name, unique within a run.
+        func (callable): The function to execute, without argument.
+        inputs (list of str): The files read by the stage.
+        outputs (list of str): The files written by the stage.
+        cpu (int): The number of cores used by the stage.
+        memory (int or callable): The peak memory used by the stage, in bytes. A callable is evaluated
+            when the stage is ready, that is once its inputs exist, so that it can depend on their size.
+        instrument (bool): Whether to record the stage into the run report. Stages running external
+            commands with run_command are already recorded.
+        unit (str): The unit of the processed items, for the run report.
+    """
+    name: str
+    func: Callable
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    cpu: int = 1
+    memory: Union[int, Callable] = 0
+    instrument: bool = False
+    unit: str = "pixels"
+
+
+
+def stage_dependencies(stages):
+    """
+    Compute the dependencies between stages: a stage depends on the last stage declared before it which writes one of its inputs,
+    and a stage writing a file depends on the last stage declared before it which writes that file.
+    The declaration order must thus be a valid sequential execution order.
+
+    Returns:
+        dict: The names of the stages each stage depends on, by stage name.
+    """
+    last_producer = {}
+    dependencies = {}
+    for s in stages:
+        if s.name in dependencies: raise ValueError(f"Duplicate stage name: {s.name}")
+        dependencies[s.name] = {last_producer[f] for f in s.inputs + s.outputs if f in last_producer}
+        dependencies[s.name].discard(s.name)
+        for f in s.outputs: last_producer[f] = s.name
+    return dependencies
+
+
+def stage_orderings(stages):
+    """
+    Compute the stages which must be finished before each stage starts, whatever their result, without depending on them:
+    a stage writing a file waits for the stages declared before it which read the previous version of that file.
+
+    Returns:
+        dict: The names of the stages each stage waits for, by stage name.
+    """
+    readers = {}
+    orderings = {}
+    for s in stages:
+        orderings[s.name] = set()
+        for f in s.outputs: orderings[s.name] |= readers.get(f, set())
+        orderings[s.name].discard(s.name)
+        for f in s.inputs: readers.setdefault(f, set()).add(s.name)
+        for f in s.outputs: readers[f] = set()
+    return orderings
+
+
+def _execute(s):
+    if not s.instrument: return s.func()
+    with perf.stage(s.name, inputs=s.inputs, outputs=s.outputs, unit=s.unit) as record:
+        result = s.func()
+        if isinstance(result, int) and not isinstance(result, bool): record["items"] = result
+        return result
+
+
+def run_stages(stages, max_cpu=None, max_memory=None, temporary=None, done=None, on_done=None):
+    """
+    Run stages concurrently, as soon as the stages they depend on are completed, within cpu and memory budgets.
+
+    When a stage fails, the stages depending on it are skipped, but the independent ones still run.
+    A stage rewriting a file waits until the stages reading its previous version are finished, but it still runs if they failed.
+    A stage larger than the budgets is run alone.
+
+    Parameters:
+        stages (list of Stage): The stages, in a valid sequential execution order.
+        max_cpu (int): The number of cores available. All cores by default.
+        max_memory (int): The memory available, in bytes. Unlimited by default.
+        temporary (list of str): Intermediate files, removed once all stages reading them have succeeded.
+        done (set of str): Names of stages already completed in a previous run, which are not executed again.
+        on_done (callable): Function called with the stage name each time a stage succeeds.
+
+    Returns:
+        dict: The status of each stage: "ok", "failed" or "skipped".
+
+    Raises:
+        RuntimeError: If any stage failed, once all the other stages have run.
+    """
+    max_cpu = max_cpu or os.cpu_count() or 1
+    temporary = set(temporary or [])
+    dependencies = stage_dependencies(stages)
+    orderings = stage_orderings(stages)
+    by_name = {s.name: s for s in stages}
+    status = {name: "ok" for name in (done or set()) if name in by_name}
+    errors = {}
+
+    def remove_temporary(s):
+        # remove the intermediate inputs of a stage once all their readers have succeeded
+        for f in set(s.inputs) & temporary:
+            readers = [r.name for r in stages if f in r.inputs]
+            if all(status.get(r) == "ok" for r in readers) and os.path.exists(f): os.remove(f)
+
+    def skip_dependents(name):
+        for s in stages:
+            if name in dependencies[s.name] and s.name not in status:
+                status[s.name] = "skipped"
+                logging.warning(f"Skip {s.name}: {name} did not succeed")
+                skip_dependents(s.name)
+
+    running, launched = {}, set()
+    cpu_used, memory_used = 0, 0
+    with ThreadPoolExecutor(max_workers=max_cpu) as executor:
+        while True:
+            # launch the ready stages which fit into the budgets
+            for s in stages:
+                if s.name in status or s.name in launched: continue
+                if not all(status.get(d) == "ok" for d in dependencies[s.name]): continue
+                if not all(o in status for o in orderings[s.name]): continue
+                memory = s.memory() if callable(s.memory) else s.memory
+                fits = cpu_used + s.cpu <= max_cpu and (max_memory is None or memory_used + memory <= max_memory)
+                if running and not fits: continue
+                logging.info(s.name)
+                running[executor.submit(_execute, s)] = (s.name, s.cpu, memory)
+                launched.add(s.name)
+                cpu_used += s.cpu
+                memory_used += memory
+
+            if not running: break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, cpu, memory = running.pop(future)
+                cpu_used -= cpu
+                memory_used -= memory
+                try:
+                    future.result()
+                    status[name] = "ok"
+                    remove_temporary(by_name[name])
+                    if on_done: on_done(name)
+                except Exception as e:
+                    status[name] = "failed"
+                    errors[name] = e
+                    logging.error(f"Stage {name} failed: {e}")
+                    skip_dependents(name)
+
+    if errors:
+        raise RuntimeError("Failed stages: " + ", ".join(f"{name} ({e})" for name, e in errors.items()))
+    return status
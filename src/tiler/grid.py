@@ -0,0 +1,29 @@
+import math
+
+
+# The Web Mercator (EPSG:3857) XYZ tile grid, shared by the raster and vector tilers.
+# Only the standard library is used, so that the tile grid can be computed without the raster libraries.
+
+
+# half size of the Web Mercator (EPSG:3857) world, in meters
+MERCATOR_ORIGIN = 20037508.342789244
+
+
+def tile_bounds(zoom, x, y):
+    """Return the (left, bottom, right, top) bounds of an XYZ tile, in Web Mercator."""
+    size = 2 * MERCATOR_ORIGIN / 2 ** zoom
+    left = -MERCATOR_ORIGIN + x * size
+    top = MERCATOR_ORIGIN - y * size
+    return left, top - size, left + size, top
+
+
+def tile_range(bounds, zoom):
+    """Return the ranges of tile columns and rows covering some Web Mercator bounds at a zoom level."""
+    size = 2 * MERCATOR_ORIGIN / 2 ** zoom
+    n = 2 ** zoom
+    left, bottom, right, top = bounds
+    x_min = max(0, int(math.floor((left + MERCATOR_ORIGIN) / size)))
+    x_max = min(n - 1, int(math.ceil((right + MERCATOR_ORIGIN) / size)) - 1)
+    y_min = max(0, int(math.floor((MERCATOR_ORIGIN - top) / size)))
+    y_max = min(n - 1, int(math.ceil((MERCATOR_ORIGIN - bottom) / size)) - 1)
+    return range(x_min, x_max + 1), range(y_min, y_max + 1)
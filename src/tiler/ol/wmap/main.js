@@ -1,13 +1,89 @@
 import './style.css';
 import {Map, View} from 'ol';
 import TileLayer from 'ol/layer/Tile';
+import VectorTileLayer from 'ol/layer/VectorTile';
+import WebGLTileLayer from 'ol/layer/WebGLTile';
 import OSM from 'ol/source/OSM';
+import XYZ from 'ol/source/XYZ';
+import VectorTileSource from 'ol/source/VectorTile';
+import MVT from 'ol/format/MVT';
+import {Fill, Stroke, Style} from 'ol/style';
+
+// vector tiles of the contours and buildings, generated with 'cartohd vtile'
+const vectorTilesUrl = './tiles/vector/{z}/{x}/{y}.pbf';
+// elevation tiles of the DSM or DTM, generated with 'cartohd tile --terrain terrarium'
+const terrainTilesUrl = './tiles/terrain/{z}/{x}/{y}.png';
+
+const styles = {
+  contours_index: new Style({stroke: new Stroke({color: '#a0522d', width: 1.2})}),
+  contours: new Style({stroke: new Stroke({color: '#a0522d', width: 0.5})}),
+  buildings: new Style({
+    fill: new Fill({color: '#888888'}),
+    stroke: new Stroke({color: '#555555', width: 0.5})
+  })
+};
+
+// elevation of a neighbour pixel, decoded from the Terrarium encoding: R * 256 + G + B / 256 - 32768.
+// The band values are normalised from 0 to 1.
+function elevation(xOffset, yOffset) {
+  return [
+    '+',
+    ['*', 255 * 256, ['band', 1, xOffset, yOffset]],
+    ['*', 255, ['band', 2, xOffset, yOffset]],
+    ['*', 255 / 256, ['band', 3, xOffset, yOffset]],
+    -32768
+  ];
+}
+
+// slope and aspect from the elevation differences of the neighbour pixels, with a vertical exaggeration
+const dp = ['*', 2, ['resolution']];
+const dzdx = ['/', ['*', ['var', 'vert'], ['-', elevation(1, 0), elevation(-1, 0)]], dp];
+const dzdy = ['/', ['*', ['var', 'vert'], ['-', elevation(0, 1), elevation(0, -1)]], dp];
+const slope = ['atan', ['sqrt', ['+', ['^', dzdx, 2], ['^', dzdy, 2]]]];
+const aspect = ['clamp', ['atan', ['-', 0, dzdx], dzdy], -Math.PI, Math.PI];
+
+// hillshade: cosine of the angle between the light and the surface normal
+const sunEl = ['*', Math.PI / 180, ['var', 'sunEl']];
+const sunAz = ['*', Math.PI / 180, ['var', 'sunAz']];
+const hillshade = ['*', 255, ['clamp', [
+  '+',
+  ['*', ['sin', sunEl], ['cos', slope]],
+  ['*', ['cos', sunEl], ['sin', slope], ['cos', ['-', sunAz, aspect]]]
+], 0, 1]];
+// slope: white for flat, black for vertical
+const slopeShade = ['-', 255, ['*', 255 / (Math.PI / 2), slope]];
+const shade = ['case', ['==', ['var', 'mode'], 1], slopeShade, hillshade];
+
+const terrain = new WebGLTileLayer({
+  opacity: 0.6,
+  source: new XYZ({
+    url: terrainTilesUrl,
+    interpolate: false,
+    minZoom: 13,
+    maxZoom: 18
+  }),
+  style: {
+    variables: {vert: 1, sunEl: 45, sunAz: 315, mode: 0},
+    color: ['color', shade, shade, shade]
+  }
+});
 
 const map = new Map({
   target: 'map',
   layers: [
     new TileLayer({
       source: new OSM()
+    }),
+    terrain,
+    new VectorTileLayer({
+      declutter: false,
+      source: new VectorTileSource({
+        format: new MVT(),
+        url: vectorTilesUrl,
+        minZoom: 13,
+        maxZoom: 16
+      }),
+      style: (feature) => styles[feature.get('layer')]
     })
   ],
   view: new View({
@@ -15,3 +91,9 @@ const map = new Map({
     zoom: 2
   })
 });
+
+// lighting controls: the shading is computed in the browser, the tiles do not change
+for (const id of ['vert', 'sunEl', 'sunAz', 'mode']) {
+  const input = document.getElementById(id);
+  input.addEventListener('input', () => terrain.updateStyleVariables({[id]: Number(input.value)}));
+}
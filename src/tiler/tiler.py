@@ -1,9 +1,12 @@
 import os
-import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import rasterio
 from rasterio.enums import Resampling
-from rasterio.windows import Window
 from PIL import Image
+import numpy as np
+
+from tiler.grid import MERCATOR_ORIGIN, tile_bounds, tile_range
 
 
 def create_tile_directory(output_dir, zoom, x, y):
@@ -13,159 +16,191 @@ def create_tile_directory(output_dir, zoom, x, y):
     return os.path.join(tile_path, f"{y}.png")
 
 
-def reproject(input_path, output_epsg, output_path):
-    """Reproject raster."""
-    import subprocess
-    subprocess.run([
-        'gdalwarp',
-        '-t_srs', 'EPSG:' + output_epsg,
-        input_path, output_path
-    ])
+def value_range(src):
+    """
+    Return the min and max physical values of a raster, from a decimated read, so that all tiles are normalized the same way.
+    """
+    scale = max(1, max(src.width, src.height) // 1024)
+    data = src.read(out_shape=(src.count, max(1, src.height // scale), max(1, src.width // scale)), masked=True, resampling=Resampling.nearest)
+    data = data.astype('float64') * src.scales[0] + src.offsets[0]
+    if data.count() == 0: return 0, 1
+    return float(data.min()), float(data.max())
 
 
-def tile_raster_xyz(input_path, output_dir, min_zoom=13, max_zoom=15, tile_size=256, origin_x=0, origin_y=0):
+def to_8bit(tile_data, src, vmin, vmax):
+    """
+    Convert tile data read with masked=True, in (height, width, band) order, to 8-bit.
+    Single band rasters of any type and encoding (scale, offset, no data) are scaled from [vmin, vmax] to [0, 255],
+    with no data pixels transparent. 8-bit multi band rasters are kept unchanged.
+    """
+    if tile_data.dtype == 'uint8' and tile_data.shape[2] >= 3: return tile_data.filled(0)
+    values = tile_data[:, :, :1].astype('float64') * src.scales[0] + src.offsets[0]
+    grey = ((values.filled(vmin) - vmin) / ((vmax - vmin) or 1) * 255).clip(0, 255).astype('uint8')
+    mask = np.ma.getmaskarray(tile_data)[:, :, :1]
+    if not mask.any(): return grey
+    alpha = np.where(mask, 0, 255).astype('uint8')
+    return np.concatenate([grey, grey, grey, alpha], axis=2)
+
+
+def save_png(tile_data, tile_path):
+    """Save 8-bit tile data, in (height, width, band) order, as a PNG file."""
+    if tile_data.shape[2] == 1:  # Single band (grayscale)
+        Image.fromarray(tile_data[:, :, 0], mode='L').save(tile_path)
+    elif tile_data.shape[2] == 3:  # RGB
+        Image.fromarray(tile_data[:, :, :3]).save(tile_path)
+    elif tile_data.shape[2] == 4:  # RGBA
+        Image.fromarray(tile_data[:, :, :4]).save(tile_path)
+    else:
+        print(f"Unexpected number of channels ({tile_data.shape[2]}) in {tile_path}")
+
+
+def _tile_raster(input_path, tile_path, min_zoom, max_zoom, tile_size, resampling, max_workers, to_rgb=None):
     """
-    Generate XYZ tiles from a raster for the specified zoom levels.
+    Render the tiles of a raster on the Web Mercator tile grid, through a warped view of the raster.
+
+    Each tile is read through its own WarpedVRT, on the tile grid: only the source pixels covering the tile are
+    reprojected, from the overviews at low zoom, without intermediate file. The tiles are rendered in parallel threads,
+    each with its own dataset handle. Tiles without data are not written.
 
     Args:
-        input_path (str): Path to the input GeoTIFF file.
-        output_dir (str): Directory to store the tiles.
+        tile_path (callable): Function of (zoom, x, y) returning the tile file path.
+        to_rgb (callable): Function of (tile_data, src) converting the tile data to 8-bit.
+            By default, the values are scaled to grey levels with to_8bit.
+    """
+    from rasterio.vrt import WarpedVRT
+    from rasterio.warp import transform_bounds
+    from rasterio.transform import from_bounds
+
+    with rasterio.open(input_path) as src:
+        if to_rgb is None:
+            # Normalize the pixel values to 8-bit, with the same range for all tiles
+            vmin, vmax = value_range(src)
+            to_rgb = lambda tile_data, src: to_8bit(tile_data, src, vmin, vmax)
+        bounds = transform_bounds(src.crs, 'EPSG:3857', *src.bounds, densify_pts=21)
+
+    local = threading.local()
+    opened = []
+
+    def render(zoom, x, y):
+        if not hasattr(local, 'src'):
+            local.src = rasterio.open(input_path)
+            opened.append(local.src)
+        src = local.src
+        with WarpedVRT(src, crs='EPSG:3857', transform=from_bounds(*tile_bounds(zoom, x, y), tile_size, tile_size),
+                       width=tile_size, height=tile_size, resampling=resampling) as vrt:
+            tile_data = vrt.read(masked=True)
+        if np.ma.getmaskarray(tile_data).all(): return 0
+
+        # Transpose to channels last for PIL (from (band, height, width) to (height, width, band))
+        tile_data = tile_data.transpose(1, 2, 0)
+        tile_data = to_rgb(tile_data, src)
+        save_png(tile_data, tile_path(zoom, x, y))
+        return 1
+
+    tiles = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_range(bounds, zoom)
+        print(f"Processing Zoom Level {zoom}: {len(xs)}x{len(ys)} tiles")
+        tiles += [(zoom, x, y) for x in xs for y in ys]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        written = sum(executor.map(lambda t: render(*t), tiles))
+    for ds in opened: ds.close()
+    print(f"{written} tiles written, {len(tiles) - written} empty")
+    return written
+
+
+def tile_raster_xyz(input_path, output_dir, min_zoom=13, max_zoom=15, tile_size=256, resampling=Resampling.nearest, max_workers=None):
+    """
+    Generate XYZ tiles from a raster for the specified zoom levels, on the Web Mercator tile grid.
+
+    Args:
+        input_path (str): Path to the input GeoTIFF file, in any CRS.
+        output_dir (str): Directory to store the tiles, as {z}/{x}/{y}.png.
         min_zoom (int): Minimum zoom level (e.g., 13).
         max_zoom (int): Maximum zoom level (e.g., 15).
         tile_size (int): Size of the tiles (typically 256).
-        origin_x (int): X coordinate of the tiling scheme origin.
-        origin_y (int): Y coordinate of the tiling scheme origin.
+        resampling (Resampling): Resampling method. Use average or bilinear for continuous values.
+        max_workers (int): Number of threads rendering tiles. Default of ThreadPoolExecutor.
+
+    Returns:
+        int: The number of tiles written.
     """
-    with rasterio.open(input_path) as src:
+    return _tile_raster(input_path, lambda zoom, x, y: create_tile_directory(output_dir, zoom, x, y),
+                        min_zoom, max_zoom, tile_size, resampling, max_workers)
+
+
+def to_terrain_rgb(tile_data, src, encoding='terrarium'):
+    """
+    Encode the elevations of tile data read with masked=True, in (height, width, band) order, as RGBA,
+    with no data pixels transparent.
 
-        # Get the raster bounds
-        left, bottom, right, top = src.bounds
-
-        for zoom in range(min_zoom, max_zoom + 1):
-            # Calculate the resolution for the zoom level
-            scale_factor = 2 ** (max_zoom - zoom)
-            
-            width = int(src.width / scale_factor)
-            height = int(src.height / scale_factor)
-            
-            print(f"Processing Zoom Level {zoom}: Width={width}, Height={height}")
-
-            # Calculate how many tiles are required at this zoom level
-            x_tiles = math.ceil(width / tile_size)
-            y_tiles = math.ceil(height / tile_size)
-
-            for x in range(x_tiles):
-                for y in range(y_tiles):
-                    
-                    # Calculate pixel coordinates of the tile in the downsampled raster
-                    window = Window(
-                        col_off=(x * tile_size + origin_x) * scale_factor,
-                        row_off=(y * tile_size + origin_y) * scale_factor,
-                        width=tile_size * scale_factor,
-                        height=tile_size * scale_factor
-                    )
-                    
-                    # Read and resample the tile
-                    tile_data = src.read(
-                        out_shape=(
-                            src.count,
-                            tile_size,
-                            tile_size
-                        ),
-                        window=window,
-                        resampling=Resampling.nearest
-                    )
-                    
-                    # Transpose to channels last for PIL (from (band, height, width) to (height, width, band))
-                    tile_data = tile_data.transpose(1, 2, 0)
-                    
-                    # Normalize the pixel values to 8-bit (if not already 8-bit)
-                    if tile_data.dtype != 'uint8':
-                        tile_data = ((tile_data - tile_data.min()) / (tile_data.max() - tile_data.min()) * 255).astype('uint8')
-                    
-                    # Save as PNG
-                    tile_path = create_tile_directory(output_dir, zoom, x, y)
-                    
-                    if tile_data.shape[2] == 1:  # Single band (grayscale)
-                        Image.fromarray(tile_data[:, :, 0], mode='L').save(tile_path)
-                    elif tile_data.shape[2] == 3:  # RGB
-                        Image.fromarray(tile_data[:, :, :3]).save(tile_path)
-                    elif tile_data.shape[2] == 4:  # RGBA
-                        Image.fromarray(tile_data[:, :, :4]).save(tile_path)
-                    else:
-                        print(f"Unexpected number of channels ({tile_data.shape[2]}) in {tile_path}")
-
-
-
-
-
-def tile_raster_wmts(input_path, output_dir, min_zoom=13, max_zoom=15, tile_size=256, origin_x=0, origin_y=0):
+    Two encodings are supported, both decoded by web map clients:
+    - 'mapbox' (Mapbox Terrain-RGB): elevation = -10000 + (R * 65536 + G * 256 + B) * 0.1, with 10 cm precision.
+    - 'terrarium' (Mapzen Terrarium): elevation = R * 256 + G + B / 256 - 32768, with a precision of 1/256 m,
+      suited to the 20 cm products.
     """
-    Generate WMTS-compliant tiles from a raster for the specified zoom levels.
+    elevation = tile_data[:, :, 0].astype('float64') * src.scales[0] + src.offsets[0]
+    mask = np.ma.getmaskarray(elevation)
+    elevation = elevation.filled(0)
+    if encoding == 'mapbox':
+        v = np.clip(np.rint((elevation + 10000) * 10), 0, 2 ** 24 - 1).astype('uint32')
+        r, g, b = v // 65536, (v // 256) % 256, v % 256
+    elif encoding == 'terrarium':
+        v = np.clip(np.rint((elevation + 32768) * 256), 0, 2 ** 24 - 1).astype('uint32')
+        r, g, b = v // 65536, (v // 256) % 256, v % 256
+    else:
+        raise ValueError(f"Unknown terrain encoding: {encoding}")
+    alpha = np.where(mask, 0, 255)
+    return np.stack([r, g, b, alpha], axis=2).astype('uint8')
+
+
+def tile_terrain_rgb(input_path, output_dir, min_zoom=13, max_zoom=15, tile_size=256, encoding='terrarium', resampling=Resampling.bilinear, max_workers=None):
+    """
+    Generate XYZ elevation tiles from a DSM or DTM, encoded as RGB PNG without loss, for hillshading and slopes
+    computed by the client (see ol/wmap).
 
     Args:
-        input_path (str): Path to the input GeoTIFF file.
-        output_dir (str): Directory to store the tiles.
+        input_path (str): Path to the input elevation GeoTIFF file, in any CRS and encoding.
+        output_dir (str): Directory to store the tiles, as {z}/{x}/{y}.png.
         min_zoom (int): Minimum zoom level (e.g., 13).
         max_zoom (int): Maximum zoom level (e.g., 15).
         tile_size (int): Size of the tiles (typically 256).
-        origin_x (int): X coordinate of the tiling scheme origin.
-        origin_y (int): Y coordinate of the tiling scheme origin.
+        encoding (str): 'terrarium' or 'mapbox', see to_terrain_rgb.
+        resampling (Resampling): Resampling method.
+        max_workers (int): Number of threads rendering tiles. Default of ThreadPoolExecutor.
+
+    Returns:
+        int: The number of tiles written.
     """
-    with rasterio.open(input_path) as src:
-        # Get the raster bounds
-        left, bottom, right, top = src.bounds
-
-        for zoom in range(min_zoom, max_zoom + 1):
-            scale_factor = 2 ** (max_zoom - zoom)
-            width = int(src.width / scale_factor)
-            height = int(src.height / scale_factor)
-            print(f"Processing Zoom Level {zoom}: Width={width}, Height={height}")
-
-            x_tiles = math.ceil(width / tile_size)
-            y_tiles = math.ceil(height / tile_size)
-
-            for x in range(x_tiles):
-                for y in range(y_tiles):
-                    tile_row = (y_tiles - 1) - y  # WMTS tile row is from bottom-left origin
-                    tile_col = x
-                    
-                    # Calculate pixel coordinates of the tile in the downsampled raster
-                    window = Window(
-                        col_off=(x * tile_size + origin_x) * scale_factor,
-                        row_off=(y * tile_size + origin_y) * scale_factor,
-                        width=tile_size * scale_factor,
-                        height=tile_size * scale_factor
-                    )
-                    
-                    tile_data = src.read(
-                        out_shape=(
-                            src.count,
-                            tile_size,
-                            tile_size
-                        ),
-                        window=window,
-                        resampling=Resampling.nearest
-                    )
-                    
-                    tile_data = tile_data.transpose(1, 2, 0)  # Rearrange from (band, height, width) to (height, width, band)
-                    
-                    if tile_data.dtype != 'uint8':
-                        tile_data = ((tile_data - tile_data.min()) / (tile_data.max() - tile_data.min()) * 255).astype('uint8')
-                    
-                    tile_path = create_tile_directory(output_dir, zoom, tile_row, tile_col)
-                    
-                    if tile_data.shape[2] == 1:  # Single band (grayscale)
-                        Image.fromarray(tile_data[:, :, 0], mode='L').save(tile_path)
-                    elif tile_data.shape[2] == 3:  # RGB
-                        Image.fromarray(tile_data[:, :, :3]).save(tile_path)
-                    elif tile_data.shape[2] == 4:  # RGBA
-                        Image.fromarray(tile_data[:, :, :4]).save(tile_path)
-                    else:
-                        print(f"Unexpected number of channels ({tile_data.shape[2]}) in {tile_path}")
-
-
-
-
-tile_raster_wmts("/home/juju/lidar_mapping/athenee/hillshade_dsm.tif", "/home/juju/Bureau/test_tiling/", min_zoom=13, max_zoom=15, tile_size=256)
+    return _tile_raster(input_path, lambda zoom, x, y: create_tile_directory(output_dir, zoom, x, y),
+                        min_zoom, max_zoom, tile_size, resampling, max_workers,
+                        to_rgb=lambda tile_data, src: to_terrain_rgb(tile_data, src, encoding))
+
+
+def tile_raster_wmts(input_path, output_dir, min_zoom=13, max_zoom=15, tile_size=256, resampling=Resampling.nearest, max_workers=None):
+    """
+    Generate WMTS tiles from a raster for the specified zoom levels, on the GoogleMapsCompatible tile matrix set.
+
+    Args:
+        input_path (str): Path to the input GeoTIFF file, in any CRS.
+        output_dir (str): Directory to store the tiles, as {TileMatrix}/{TileRow}/{TileCol}.png.
+        min_zoom (int): Minimum zoom level (e.g., 13).
+        max_zoom (int): Maximum zoom level (e.g., 15).
+        tile_size (int): Size of the tiles (typically 256).
+        resampling (Resampling): Resampling method. Use average or bilinear for continuous values.
+        max_workers (int): Number of threads rendering tiles. Default of ThreadPoolExecutor.
+
+    Returns:
+        int: The number of tiles written.
+    """
+    # the GoogleMapsCompatible tile rows start from the top, as the XYZ ones
+    return _tile_raster(input_path, lambda zoom, x, y: create_tile_directory(output_dir, zoom, y, x),
+                        min_zoom, max_zoom, tile_size, resampling, max_workers)
+
+
+
+
+if __name__ == "__main__":
+    tile_raster_wmts("/home/juju/lidar_mapping/athenee/hillshade_dsm.tif", "/home/juju/Bureau/test_tiling/", min_zoom=13, max_zoom=15, tile_size=256)
 
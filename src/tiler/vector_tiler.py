@@ -0,0 +1,241 @@
+import os
+import json
+import math
+import shutil
+import sqlite3
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from tiler.grid import MERCATOR_ORIGIN, tile_bounds, tile_range
+
+
+# Vector tiles (Mapbox Vector Tiles) of the contours and buildings, for the web viewer.
+# The tiles are cut by the GDAL MVT driver, on the Web Mercator tiling scheme, in the XYZ layout {z}/{x}/{y}.pbf.
+# They are styled by the client: a style change does not require to generate the tiles again.
+# The tiles are cut by several ogr2ogr processes in parallel, each on a zoom level or on a range of tile columns of it:
+# the highest zoom level holds about 3/4 of the tiles.
+
+
+# Default layers: target layer name, source file in the output folder, attribute filter and zoom range.
+# Only the index contours are shown at low zoom, all contours from zoom 16.
+VECTOR_LAYERS = [
+    {"name": "contours_index", "source": "contours.gpkg", "where": "type = 'index'", "minzoom": 13, "maxzoom": 16},
+    {"name": "contours", "source": "contours.gpkg", "where": "type = 'normal'", "minzoom": 16, "maxzoom": 16},
+    {"name": "buildings", "source": "building_simplified.gpkg", "where": None, "minzoom": 14, "maxzoom": 16},
+]
+
+# margin of the features clipped around a range of tile columns, as a fraction of the tile size.
+# It is larger than the buffer of the MVT tiles (80 units of 4096), so that the tiles on the edges of the range are complete.
+CLIP_MARGIN = 0.05
+
+
+def prepare_layers(input_folder, layers, output_file):
+    """
+    Gather the features of the layers into a single GPKG file in Web Mercator, one layer per tile layer.
+
+    Args:
+        input_folder (str): Folder of the source files.
+        layers (list of dict): The tile layers, see VECTOR_LAYERS.
+        output_file (str): The GPKG file to write.
+    """
+    if os.path.exists(output_file): os.remove(output_file)
+    for layer in layers:
+        command = ["ogr2ogr", "-f", "GPKG", "-append", "-nln", layer["name"], "-t_srs", "EPSG:3857",
+                   output_file, os.path.join(input_folder, layer["source"])]
+        if layer.get("where"): command += ["-where", layer["where"]]
+        subprocess.run(command, check=True)
+
+
+def layers_extent(gpkg_file):
+    """
+    Return the (left, bottom, right, top) extent of all layers of a GPKG file, from its gpkg_contents table,
+    or None if the layers are empty.
+    """
+    db = sqlite3.connect(gpkg_file)
+    try:
+        extent = db.execute("SELECT MIN(min_x), MIN(min_y), MAX(max_x), MAX(max_y) FROM gpkg_contents").fetchone()
+    finally:
+        db.close()
+    return None if None in extent else extent
+
+
+def split_jobs(bounds, zooms, parts):
+    """
+    Split the tiles of some zoom levels covering Web Mercator bounds into about the given number of jobs of similar size.
+
+    A zoom level with more tiles than a job is split into ranges of tile columns. The jobs are ordered from the largest.
+
+    Args:
+        bounds (tuple): The (left, bottom, right, top) bounds to cover, in Web Mercator.
+        zooms (list of int): The zoom levels.
+        parts (int): The number of jobs wanted, usually the number of workers.
+
+    Returns:
+        list of tuple: The (zoom, columns) jobs, columns being a range of tile columns, all of them when the zoom level is not split.
+    """
+    ranges = {z: tile_range(bounds, z) for z in zooms}
+    tiles = {z: len(xs) * len(ys) for z, (xs, ys) in ranges.items()}
+    size = max(1, math.ceil(sum(tiles.values()) / max(1, parts)))
+    jobs = []
+    for z in sorted(zooms, reverse=True):
+        xs = ranges[z][0]
+        if len(xs) == 0: continue
+        step = math.ceil(len(xs) / max(1, min(len(xs), math.ceil(tiles[z] / size))))
+        jobs += [(z, xs[i:i + step]) for i in range(0, len(xs), step)]
+    return jobs
+
+
+def _tile_job(source, output_dir, zoom, columns, clip, conf, simplification, compress):
+    # tiles of a zoom level, in their own folder: the MVT driver does not write into an existing folder.
+    # When the zoom level is split, the features are clipped around the range of tile columns
+    shutil.rmtree(output_dir, ignore_errors=True)
+    command = [
+        "ogr2ogr", "-f", "MVT", output_dir, source,
+        "-dsco", f"MINZOOM={zoom}", "-dsco", f"MAXZOOM={zoom}",
+        "-dsco", f"CONF={json.dumps(conf)}",
+        "-dsco", f"SIMPLIFICATION={simplification}",
+        "-dsco", f"COMPRESS={'YES' if compress else 'NO'}",
+    ]
+    if clip:
+        size = 2 * MERCATOR_ORIGIN / 2 ** zoom
+        left, right = tile_bounds(zoom, columns[0], 0)[0], tile_bounds(zoom, columns[-1], 0)[2]
+        command += ["-clipsrc", *map(str, [left - CLIP_MARGIN * size, -MERCATOR_ORIGIN, right + CLIP_MARGIN * size, MERCATOR_ORIGIN])]
+    subprocess.run(command, check=True)
+
+
+def _merge_metadata(metadata, other):
+    # union of the bounds and vector layers of the metadata of two jobs
+    if metadata is None: return other
+    if metadata.get("bounds") and other.get("bounds"):
+        a, b = [float(v) for v in metadata["bounds"].split(",")], [float(v) for v in other["bounds"].split(",")]
+        bounds = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+        metadata["bounds"] = ",".join(str(v) for v in bounds)
+        metadata["center"] = f"{(bounds[0] + bounds[2]) / 2},{(bounds[1] + bounds[3]) / 2}"
+    layers = json.loads(metadata.get("json") or "{}")
+    known = {vl["id"]: vl for vl in layers.get("vector_layers", [])}
+    for vl in json.loads(other.get("json") or "{}").get("vector_layers", []):
+        if vl["id"] in known: known[vl["id"]].setdefault("fields", {}).update(vl.get("fields", {}))
+        else: layers.setdefault("vector_layers", []).append(vl)
+    metadata["json"] = json.dumps(layers)
+    return metadata
+
+
+def tile_vector_mvt(input_folder, output, layers=None, min_zoom=13, max_zoom=16, simplification=1, max_workers=None):
+    """
+    Generate Mapbox Vector Tiles from the contours and buildings, in parallel.
+
+    The tiles are split into jobs of similar size, see split_jobs: the low zoom levels are processed whole,
+    the high ones by ranges of tile columns, so that all workers share the work of the highest zoom level.
+    The geometries are simplified at each zoom level according to the tile resolution,
+    and each layer is only written within its zoom range. The layers outside of the requested zoom levels are ignored.
+
+    Args:
+        input_folder (str): Folder of the source files, usually the cartoHDprocess output folder.
+        output (str): Output tiles folder, or MBTiles file if it ends with '.mbtiles'.
+        layers (list of dict): The tile layers, see VECTOR_LAYERS.
+        min_zoom (int): Minimum zoom level.
+        max_zoom (int): Maximum zoom level. The client overzooms the tiles beyond it.
+        simplification (float): Simplification tolerance, in tile pixels (the tile extent being 4096).
+        max_workers (int): Number of ogr2ogr processes run concurrently. The number of cores by default.
+
+    Returns:
+        dict: The number of tiles and their total size, in bytes.
+    """
+    layers = layers or VECTOR_LAYERS
+    layers = [l for l in layers if os.path.exists(os.path.join(input_folder, l["source"]))]
+    if not layers: raise ValueError(f"No vector file to tile in {input_folder}")
+    # layers whose zoom range is outside of the requested one: an inverted range in CONF makes the MVT driver fail
+    layers = [l for l in layers if max(l["minzoom"], min_zoom) <= min(l["maxzoom"], max_zoom)]
+    if not layers: raise ValueError(f"No layer to tile between zoom levels {min_zoom} and {max_zoom}")
+
+    archive = output.endswith(".mbtiles")
+    tiles_dir = output[:-len(".mbtiles")] + "_tiles" if archive else output
+    work_dir = tiles_dir + "_tmp"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    source = os.path.join(work_dir, "layers.gpkg")
+    prepare_layers(input_folder, layers, source)
+    conf = {l["name"]: {"target_name": l["name"], "minzoom": max(l["minzoom"], min_zoom), "maxzoom": min(l["maxzoom"], max_zoom)} for l in layers}
+
+    zooms = list(range(min_zoom, max_zoom + 1))
+    max_workers = max_workers or os.cpu_count() or 1
+    extent = layers_extent(source)
+    jobs = split_jobs(extent, zooms, max_workers) if extent else []
+    for z in zooms:
+        logging.info(f"Zoom level {z}: {sum(1 for zoom, _ in jobs if zoom == z)} jobs")
+
+    def job_dir(zoom, columns): return os.path.join(work_dir, f"{zoom}_{columns[0]}")
+    def run(job):
+        zoom, columns = job
+        clip = len(columns) < len(tile_range(extent, zoom)[0])
+        _tile_job(source, job_dir(zoom, columns), zoom, columns, clip, conf, simplification, archive)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(run, jobs))
+
+    # merge the jobs into the output folder, keeping the tiles of their range of columns only:
+    # the tiles around it hold the clipped features only, and are written by the neighbour jobs
+    shutil.rmtree(tiles_dir, ignore_errors=True)
+    os.makedirs(tiles_dir)
+    metadata = None
+    for zoom, columns in jobs:
+        zoom_dir = os.path.join(job_dir(zoom, columns), str(zoom))
+        for x in columns:
+            if os.path.exists(os.path.join(zoom_dir, str(x))):
+                shutil.move(os.path.join(zoom_dir, str(x)), os.path.join(tiles_dir, str(zoom), str(x)))
+        if os.path.exists(os.path.join(job_dir(zoom, columns), "metadata.json")):
+            with open(os.path.join(job_dir(zoom, columns), "metadata.json")) as f: metadata = _merge_metadata(metadata, json.load(f))
+    metadata = metadata or {"format": "pbf", "json": "{}"}
+    metadata.update(minzoom=min_zoom, maxzoom=max_zoom)
+    if metadata.get("center"): metadata["center"] = ",".join(metadata["center"].split(",")[:2] + [str(min_zoom)])
+    layers_json = json.loads(metadata.get("json") or "{}")
+    for vl in layers_json.get("vector_layers", []):
+        if vl["id"] in conf: vl.update(minzoom=conf[vl["id"]]["minzoom"], maxzoom=conf[vl["id"]]["maxzoom"])
+    metadata["json"] = json.dumps(layers_json)
+    with open(os.path.join(tiles_dir, "metadata.json"), "w") as f: json.dump(metadata, f, indent=3)
+    shutil.rmtree(work_dir)
+
+    count, size = 0, 0
+    for root, _, files in os.walk(tiles_dir):
+        for file in files:
+            if file.endswith(".pbf"):
+                count += 1
+                size += os.path.getsize(os.path.join(root, file))
+    logging.info(f"{count} vector tiles, {size / 2**20:.1f} MB")
+
+    if archive:
+        pack_mbtiles(tiles_dir, output)
+        shutil.rmtree(tiles_dir)
+    return {"tiles": count, "bytes": size}
+
+
+def pack_mbtiles(tiles_dir, mbtiles_file):
+    """
+    Pack a folder of XYZ vector tiles, with its metadata.json file, into an MBTiles file.
+
+    Args:
+        tiles_dir (str): The tiles folder, in the {z}/{x}/{y}.pbf layout.
+        mbtiles_file (str): The MBTiles file to write.
+    """
+    if os.path.exists(mbtiles_file): os.remove(mbtiles_file)
+    with open(os.path.join(tiles_dir, "metadata.json")) as f: metadata = json.load(f)
+
+    db = sqlite3.connect(mbtiles_file)
+    db.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    db.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    db.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+    db.executemany("INSERT INTO metadata VALUES (?, ?)", [(k, str(v)) for k, v in metadata.items()])
+
+    for z in sorted(os.listdir(tiles_dir)):
+        if not z.isdigit(): continue
+        for x in os.listdir(os.path.join(tiles_dir, z)):
+            rows = []
+            for file in os.listdir(os.path.join(tiles_dir, z, x)):
+                y = int(file.split(".")[0])
+                with open(os.path.join(tiles_dir, z, x, file), "rb") as f:
+                    # MBTiles rows follow the TMS scheme, from the bottom
+                    rows.append((int(z), int(x), 2 ** int(z) - 1 - y, f.read()))
+            db.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+    db.commit()
+    db.close()
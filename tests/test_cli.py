@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import cli
+
+
+class TestParseSize(unittest.TestCase):
+
+    def test_sizes(self):
+        self.assertEqual(cli.parse_size("32G"), 32 * 2**30)
+        self.assertEqual(cli.parse_size("1.5k"), 1536)
+        self.assertEqual(cli.parse_size("512MB"), 512 * 2**20)
+        self.assertEqual(cli.parse_size("1000"), 1000)
+        self.assertEqual(cli.parse_size(2048), 2048)
+        self.assertIsNone(cli.parse_size(None))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError): cli.parse_size("lots")
+
+
+class TestLoadJob(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.folder.name, name)
+        with open(path, "w") as f: f.write(text)
+        return path
+
+    def test_toml(self):
+        job = cli.load_job(self.write("job.toml", 'data_root = "d"\noutput_root = "o"\nareas = ["a"]\nmax_memory = "2G"\n'))
+        self.assertEqual(job["areas"], ["a"])
+        self.assertEqual(job["max_memory"], 2 * 2**30)
+        # defaults of the missing parameters
+        self.assertEqual(job["case"], cli.JOB_DEFAULTS["case"])
+        self.assertEqual(set(job), set(cli.JOB_DEFAULTS))
+
+    def test_json(self):
+        job = cli.load_job(self.write("job.json", json.dumps({"data_root": "d", "output_root": "o", "streaming": True})))
+        self.assertTrue(job["streaming"])
+
+    def test_example(self):
+        job = cli.load_job(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "job_example.toml"))
+        self.assertEqual(set(job), set(cli.JOB_DEFAULTS))
+
+    def test_unknown_parameter(self):
+        with self.assertRaises(ValueError): cli.load_job(self.write("job.toml", 'data_root = "d"\noutput_root = "o"\nworkers = 2\n'))
+
+    def test_missing_parameter(self):
+        with self.assertRaises(ValueError): cli.load_job(self.write("job.toml", 'data_root = "d"\n'))
+
+
+if __name__ == "__main__":
+    unittest.main()
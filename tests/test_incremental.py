@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import incremental
+from test_las_header import write_header
+
+
+class TestSnapBounds(unittest.TestCase):
+
+    def test_expanded_to_grid(self):
+        snapped = incremental.snap_bounds((10.05, 20.31, 11.01, 21.5), 0, 0, 0.2)
+        for value, expected in zip(snapped, (10.0, 20.2, 11.2, 21.6)): self.assertAlmostEqual(value, expected)
+
+    def test_grid_origin(self):
+        snapped = incremental.snap_bounds((3, 3, 7, 7), 0.5, 0.5, 2)
+        self.assertEqual(snapped, (2.5, 2.5, 8.5, 8.5))
+
+    def test_on_grid_unchanged(self):
+        self.assertEqual(incremental.snap_bounds((2, 4, 6, 8), 0, 0, 2), (2, 4, 6, 8))
+
+
+class TestChangedFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.data = os.path.join(self.folder.name, "data")
+        self.output = os.path.join(self.folder.name, "out")
+        os.makedirs(self.data)
+        os.makedirs(self.output)
+        write_header(os.path.join(self.data, "a.las"), (0, 0, 100, 100, 0, 10))
+        write_header(os.path.join(self.data, "b.las"), (100, 0, 200, 100, 0, 10))
+        incremental.save_manifest(os.path.join(self.data, "*.las"), self.output)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def changed(self):
+        return [os.path.basename(h["path"]) for h in incremental.changed_files(os.path.join(self.data, "*.las"), self.output)]
+
+    def test_unchanged(self):
+        self.assertEqual(self.changed(), [])
+
+    def test_new_and_modified(self):
+        write_header(os.path.join(self.data, "c.las"), (200, 0, 300, 100, 0, 10))
+        stat = os.stat(os.path.join(self.data, "a.las"))
+        os.utime(os.path.join(self.data, "a.las"), (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self.changed(), ["a.las", "c.las"])
+
+
+if __name__ == "__main__":
+    unittest.main()
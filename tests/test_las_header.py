@@ -0,0 +1,82 @@
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import las_header
+
+
+def write_header(path, bounds, point_count=1000, version=(1, 2), point_format=1, compressed=False):
+    """
+    Write the public header block of a LAS file, without points.
+    bounds is (xmin, ymin, xmax, ymax, zmin, zmax).
+    """
+    size = 375 if version >= (1, 4) else 227
+    data = bytearray(size)
+    data[:4] = b"LASF"
+    struct.pack_into("<BB", data, 24, *version)
+    struct.pack_into("<HI", data, 94, size, size)
+    struct.pack_into("<BH", data, 104, point_format | (0x80 if compressed else 0), 28)
+    xmin, ymin, xmax, ymax, zmin, zmax = bounds
+    struct.pack_into("<3d", data, 131, 0.01, 0.01, 0.01)
+    struct.pack_into("<3d", data, 155, xmin, ymin, 0)
+    struct.pack_into("<6d", data, 179, xmax, xmin, ymax, ymin, zmax, zmin)
+    if version >= (1, 4):
+        # legacy counts are 0 when the point count does not fit in 32 bits
+        if point_count < 2**32: struct.pack_into("<I", data, 107, point_count)
+        struct.pack_into("<Q", data, 247, point_count)
+        struct.pack_into("<Q", data, 255, point_count)
+    else:
+        struct.pack_into("<I", data, 107, point_count)
+        struct.pack_into("<I", data, 111, point_count)
+    with open(path, "wb") as f: f.write(data)
+    return path
+
+
+class TestReadHeader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.folder.name, name)
+
+    def test_las_1_2(self):
+        write_header(self.path("a.las"), (100, 200, 150, 260, 5, 40), point_count=1234)
+        h = las_header.read_header(self.path("a.las"))
+        self.assertEqual(h["version"], "1.2")
+        self.assertEqual(h["point_format"], 1)
+        self.assertFalse(h["compressed"])
+        self.assertEqual(h["point_count"], 1234)
+        self.assertEqual(h["points_by_return"][0], 1234)
+        self.assertEqual(h["bounds"], (100, 200, 150, 260, 5, 40))
+
+    def test_laz_1_4_large_count(self):
+        write_header(self.path("a.laz"), (0, 0, 1, 1, 0, 1), point_count=5 * 2**32, version=(1, 4), point_format=6, compressed=True)
+        h = las_header.read_header(self.path("a.laz"))
+        self.assertEqual(h["version"], "1.4")
+        self.assertEqual(h["point_format"], 6)
+        self.assertTrue(h["compressed"])
+        self.assertEqual(h["point_count"], 5 * 2**32)
+
+    def test_not_las(self):
+        with open(self.path("a.las"), "wb") as f: f.write(b"\0" * 400)
+        with self.assertRaises(ValueError): las_header.read_header(self.path("a.las"))
+
+    def test_headers_bounds(self):
+        write_header(self.path("a.las"), (100, 200, 150, 260, 0, 1))
+        write_header(self.path("b.las"), (150, 180, 220, 240, 0, 1))
+        headers = las_header.read_headers(self.path("*.las"))
+        self.assertEqual([os.path.basename(h["path"]) for h in headers], ["a.las", "b.las"])
+        self.assertEqual(las_header.union_bounds(headers), (100, 180, 220, 260))
+        self.assertEqual(las_header.parse_bounds(las_header.format_bounds((100, 180, 220, 260))), (100, 180, 220, 260))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import planner
+
+
+class TestCalibrate(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def report(self, name, stages):
+        path = os.path.join(self.folder.name, name)
+        with open(path, "w") as f: json.dump({"stages": stages}, f)
+        return path
+
+    def test_default_model(self):
+        model = planner.calibrate([])
+        self.assertEqual(model, planner.STAGE_MODEL)
+        self.assertIsNot(model["smooth"], planner.STAGE_MODEL["smooth"])
+
+    def test_measures(self):
+        self.report("a.json", [
+            {"name": "gdaldem slope", "kind": "command", "items": 1000, "wall_s": 1, "peak_rss_bytes": 8000},
+            {"name": "gdaldem slope", "kind": "command", "items": 3000, "wall_s": 1, "peak_rss_bytes": 9000},
+            # failed stages and unknown stages are ignored
+            {"name": "gdaldem slope", "kind": "command", "items": 1000, "wall_s": 100, "status": "error"},
+            {"name": "unknown", "kind": "command", "items": 1000, "wall_s": 1},
+        ])
+        model = planner.calibrate([os.path.join(self.folder.name, "*.json")])
+        self.assertEqual(model["gdaldem slope"]["items_per_s"], 2000)
+        self.assertEqual(model["gdaldem slope"]["bytes_per_item"], 8)
+        self.assertTrue(model["gdaldem slope"]["calibrated"])
+        self.assertNotIn("calibrated", model["smooth"])
+
+    def test_python_stage_memory_not_calibrated(self):
+        # the peak memory of a Python stage is the one of the whole process
+        self.report("a.json", [{"name": "smooth", "kind": "python", "items": 1000, "wall_s": 2, "process_peak_rss_bytes": 10**9}])
+        model = planner.calibrate([os.path.join(self.folder.name, "a.json")])
+        self.assertEqual(model["smooth"]["items_per_s"], 500)
+        self.assertEqual(model["smooth"]["bytes_per_item"], planner.STAGE_MODEL["smooth"]["bytes_per_item"])
+
+
+class TestEstimate(unittest.TestCase):
+
+    def test_stages(self):
+        stages = planner.estimate(1000, 2000, planner.STAGE_MODEL)
+        self.assertIn("pdal pipeline", stages)
+        self.assertNotIn("rasterize streaming", stages)
+        smooth = planner.STAGE_MODEL["smooth"]
+        self.assertEqual(stages["smooth"]["items"], 2000)
+        self.assertEqual(stages["smooth"]["memory_bytes"], 2000 * smooth["bytes_per_item"])
+        self.assertAlmostEqual(stages["smooth"]["time_s"], 2000 / smooth["items_per_s"])
+
+    def test_streaming(self):
+        stages = planner.estimate(1000, 2000, planner.STAGE_MODEL, streaming=True)
+        self.assertNotIn("pdal pipeline", stages)
+        self.assertGreaterEqual(stages["rasterize streaming"]["memory_bytes"], 2000 * planner.STREAMING_BYTES_PER_PIXEL)
+
+    def test_concurrent_pipelines(self):
+        pdal = planner.STAGE_MODEL["pdal pipeline"]
+        memory = 10**6 * pdal["bytes_per_item"]
+        # without budget, the four pipelines run together
+        stages = planner.estimate(10**6, 1000, planner.STAGE_MODEL)
+        self.assertEqual(stages["pdal pipeline"]["concurrent"], 4)
+        self.assertEqual(stages["pdal pipeline"]["peak_memory_bytes"], 4 * memory)
+        self.assertAlmostEqual(stages["pdal pipeline"]["time_s"], 10**6 / pdal["items_per_s"])
+        # with a budget of two pipelines, they run by two
+        stages = planner.estimate(10**6, 1000, planner.STAGE_MODEL, max_memory=2.5 * memory)
+        self.assertEqual(stages["pdal pipeline"]["concurrent"], 2)
+        self.assertEqual(stages["pdal pipeline"]["peak_memory_bytes"], 2 * memory)
+        self.assertAlmostEqual(stages["pdal pipeline"]["time_s"], 2 * 10**6 / pdal["items_per_s"])
+        # a pipeline larger than the budget runs alone
+        stages = planner.estimate(10**6, 1000, planner.STAGE_MODEL, max_memory=memory / 2)
+        self.assertEqual(stages["pdal pipeline"]["concurrent"], 1)
+
+    def test_concurrent_cpu(self):
+        self.assertEqual(planner.concurrent_runs(4, 0, max_cpu=2), 2)
+        self.assertEqual(planner.concurrent_runs(13, 0, max_cpu=64), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
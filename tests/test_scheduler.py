@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from scheduler import Stage, run_stages, stage_dependencies
+
+
+def fail():
+    raise ValueError("failure")
+
+
+class TestDependencies(unittest.TestCase):
+
+    def test_producers(self):
+        stages = [
+            Stage("a", None, outputs=["a.tif"]),
+            Stage("b", None, inputs=["a.tif"], outputs=["b.tif"]),
+            Stage("c", None, inputs=["a.tif", "b.tif"], outputs=["c.tif"]),
+            # rewrites a file: depends on its last producer
+            Stage("d", None, inputs=["b.tif"], outputs=["b.tif"]),
+        ]
+        self.assertEqual(stage_dependencies(stages), {"a": set(), "b": {"a"}, "c": {"a", "b"}, "d": {"b"}})
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError): stage_dependencies([Stage("a", None), Stage("a", None)])
+
+
+class TestRunStages(unittest.TestCase):
+
+    def test_order(self):
+        order = []
+        stages = [
+            Stage("a", lambda: order.append("a"), outputs=["a"]),
+            Stage("b", lambda: order.append("b"), inputs=["a"], outputs=["b"]),
+            Stage("c", lambda: order.append("c"), inputs=["b"], outputs=["c"]),
+        ]
+        self.assertEqual(run_stages(stages, max_cpu=4), {"a": "ok", "b": "ok", "c": "ok"})
+        self.assertEqual(order, ["a", "b", "c"])
+
+    def test_skip_dependents(self):
+        ran = []
+        stages = [
+            Stage("a", fail, outputs=["a"]),
+            Stage("b", lambda: ran.append("b"), inputs=["a"], outputs=["b"]),
+            Stage("c", lambda: ran.append("c"), inputs=["b"], outputs=["c"]),
+            Stage("d", lambda: ran.append("d"), outputs=["d"]),
+        ]
+        with self.assertRaises(RuntimeError): run_stages(stages, max_cpu=4)
+        self.assertEqual(ran, ["d"])
+
+    def test_failed_reader_does_not_skip_rewrite(self):
+        ran = []
+        stages = [
+            Stage("make", lambda: ran.append("make"), outputs=["a"]),
+            Stage("read", fail, inputs=["a"], outputs=["b"]),
+            # rewrites "a" once "read" is finished, whatever its result
+            Stage("rewrite", lambda: ran.append("rewrite"), inputs=["a"], outputs=["a"]),
+            Stage("after", lambda: ran.append("after"), inputs=["b"], outputs=["c"]),
+        ]
+        with self.assertRaises(RuntimeError): run_stages(stages, max_cpu=4)
+        self.assertEqual(ran, ["make", "rewrite"])
+
+    def test_memory_budget(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+        def work():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock: running[0] -= 1
+
+        stages = [Stage(str(i), work, outputs=[str(i)], memory=60) for i in range(4)]
+        run_stages(stages, max_cpu=4, max_memory=100)
+        self.assertEqual(peak[0], 1)
+        peak[0] = 0
+        run_stages(stages, max_cpu=4, max_memory=200)
+        self.assertEqual(peak[0], 3)
+
+    def test_resume(self):
+        ran, completed = [], []
+        stages = [
+            Stage("a", lambda: ran.append("a"), outputs=["a"]),
+            Stage("b", lambda: ran.append("b"), inputs=["a"], outputs=["b"]),
+        ]
+        status = run_stages(stages, done={"a"}, on_done=completed.append)
+        self.assertEqual(status, {"a": "ok", "b": "ok"})
+        self.assertEqual(ran, ["b"])
+        self.assertEqual(completed, ["b"])
+
+    def test_temporary_removed(self):
+        with tempfile.TemporaryDirectory() as folder:
+            tmp = os.path.join(folder, "tmp.tif")
+            stages = [
+                Stage("a", lambda: open(tmp, "w").close(), outputs=[tmp]),
+                Stage("b", lambda: None, inputs=[tmp], outputs=["b"]),
+            ]
+            run_stages(stages, temporary=[tmp])
+            self.assertFalse(os.path.exists(tmp))
+
+
+if __name__ == "__main__":
+    unittest.main()
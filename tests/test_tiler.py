@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tiler.grid import MERCATOR_ORIGIN, tile_bounds, tile_range
+from tiler.vector_tiler import split_jobs
+
+
+class TestTileGrid(unittest.TestCase):
+
+    def test_world_tile(self):
+        self.assertEqual(tile_bounds(0, 0, 0), (-MERCATOR_ORIGIN, -MERCATOR_ORIGIN, MERCATOR_ORIGIN, MERCATOR_ORIGIN))
+
+    def test_tile_bounds(self):
+        # the tile rows go from the north to the south
+        left, bottom, right, top = tile_bounds(1, 1, 0)
+        self.assertEqual((left, bottom, right, top), (0, 0, MERCATOR_ORIGIN, MERCATOR_ORIGIN))
+        left, bottom, right, top = tile_bounds(2, 0, 3)
+        self.assertEqual(left, -MERCATOR_ORIGIN)
+        self.assertAlmostEqual(top, -MERCATOR_ORIGIN / 2, places=6)
+
+    def test_range_of_tile(self):
+        # bounds within a tile are covered by this tile only
+        left, bottom, right, top = tile_bounds(15, 16800, 11300)
+        xs, ys = tile_range((left + 1, bottom + 1, right - 1, top - 1), 15)
+        self.assertEqual((list(xs), list(ys)), ([16800], [11300]))
+
+    def test_range_covers_bounds(self):
+        bounds = (100000, 5000000, 150000, 5020000)
+        for zoom in [10, 14]:
+            xs, ys = tile_range(bounds, zoom)
+            first, last = tile_bounds(zoom, xs[0], ys[0]), tile_bounds(zoom, xs[-1], ys[-1])
+            self.assertLessEqual(first[0], bounds[0])
+            self.assertGreaterEqual(first[3], bounds[3])
+            self.assertGreaterEqual(last[2], bounds[2])
+            self.assertLessEqual(last[1], bounds[1])
+
+    def test_range_clamped_to_world(self):
+        xs, ys = tile_range((-1e9, -1e9, 1e9, 1e9), 2)
+        self.assertEqual((xs, ys), (range(0, 4), range(0, 4)))
+
+
+class TestSplitJobs(unittest.TestCase):
+
+    bounds = (100000, 5000000, 150000, 5020000)
+
+    def test_jobs_cover_all_columns_once(self):
+        zooms = list(range(10, 17))
+        jobs = split_jobs(self.bounds, zooms, 8)
+        for z in zooms:
+            columns = [x for zoom, xs in jobs if zoom == z for x in xs]
+            self.assertEqual(columns, list(tile_range(self.bounds, z)[0]))
+
+    def test_highest_zoom_split_across_workers(self):
+        jobs = split_jobs(self.bounds, [13, 14, 15, 16], 8)
+        self.assertEqual(jobs[0][0], 16)
+        self.assertGreater(sum(1 for zoom, _ in jobs if zoom == 16), 4)
+        self.assertEqual(sum(1 for zoom, _ in jobs if zoom == 13), 1)
+
+    def test_single_worker(self):
+        jobs = split_jobs(self.bounds, [13, 14], 1)
+        self.assertEqual([(zoom, xs) for zoom, xs in jobs], [(z, tile_range(self.bounds, z)[0]) for z in [14, 13]])
+
+
+if __name__ == "__main__":
+    unittest.main()